@@ -0,0 +1,469 @@
+# bench.py
+'''
+Benchmarks for spider solitaire.
+Run "python bench.py" for all of them, or name the ones wanted.
+
+Every workload is seeded, so a run does the same work every time.  Each
+benchmark reports the best time per operation, in microseconds, over
+several samples, each of which times the operation for at least MIN_BATCH
+seconds.  Each benchmark runs in a fresh interpreter, so that it measures
+the same whether it is run alone or after the others, and with it, in the
+same interpreter, a REFERENCE workload that does not touch the game is
+timed too.  The benchmarks are run ROUNDS times over, and each time is
+reported as the median, over the rounds, of its ratio to the reference
+time of its round, multiplied by the median reference time of the run.
+Dividing by the reference takes out a spell when the machine is slow, and
+the median a round that was unlucky all the same.
+
+The times can be saved as a JSON baseline with --save, and a later run
+compared with it with --baseline; the run fails if any time has grown by
+more than the threshold, and by more than the noise floor.  The baseline
+is scaled by how much faster or slower the reference has become, so that
+a machine that is slower today does not fail the comparison.
+
+The simulate benchmarks time whole games of the greedy policy, and their
+times are also given as games a minute, against simulate.TARGET_RATE.
+
+The view benchmarks need an X display.  If there is none, and Xvfb is
+installed, a virtual display is started for them; otherwise they are
+skipped.
+'''
+import os, sys, gc, json, time, timeit, statistics, shutil, argparse, subprocess, contextlib
+from types import SimpleNamespace
+from model import Model, Card, ACE, KING, DEAL
+from state import State
+import simulate
+
+GAME_LENGTH = 500       # moves in the games played by the model benchmarks
+GREEDY_GAMES = 200      # deals played by the simulate benchmarks
+THRESHOLD = 0.25        # slowdown, as a fraction, counted as a regression
+NOISE_FLOOR = 0.1       # slowdown, in microseconds, too small to count whatever the fraction
+MIN_BATCH = 0.01        # seconds timed in each sample
+MIN_CALLS = 100         # calls timed in each sample, when there is a setup
+REPEAT = 3              # samples of each benchmark in each round
+ROUNDS = 5              # times all the benchmarks are run
+XVFB_DISPLAY = ':99'    # display number for the virtual display
+XVFB_WAIT = 5.0         # seconds to wait for Xvfb to start
+
+def best(stmt, setup = None, repeat = REPEAT):
+  '''
+  Best time per call of stmt, in microseconds, over repeat samples.
+  Each sample makes as many calls as take MIN_BATCH seconds, so that the
+  timer resolution and the odd interruption are lost in it.
+  setup, if given, is called before each call and not timed, and then
+  each sample makes at least MIN_CALLS calls as well.  As in timeit, the
+  garbage collector is off while the calls are timed, since a collection
+  costs more the more objects earlier benchmarks have left behind.
+  '''
+  if setup is None:
+    timer = timeit.Timer(stmt)
+    number = 1
+    while timer.timeit(number) < MIN_BATCH:
+      number *= 2
+    return 1e6 * min(timer.repeat(repeat, number)) / number
+  times = []
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    for r in range(repeat):
+      total = 0.0
+      calls = 0
+      while total < MIN_BATCH or calls < MIN_CALLS:
+        setup()
+        start = time.perf_counter()
+        stmt()
+        total += time.perf_counter() - start
+        calls += 1
+      times.append(total / calls)
+  finally:
+    if enabled:
+      gc.enable()
+  return 1e6 * min(times)
+
+class ComparedCard:
+  '''
+  A card with the comparison operators as they were before the successor
+  tables, for comparison
+  '''
+  def __init__(self, card):
+    self.rank = card.rank
+    self.suit = card.suit
+    
+  def __lt__(self, other):
+    if self.suit != other.suit:
+      return False
+    answer = (self.rank == other.rank-1 or 
+              (Card.circular and self.rank == KING and other.rank == ACE))
+    return answer 
+  
+  def __gt__(self, other):
+    return other < self
+
+def comparedDescending(seq):
+  return all(map(lambda x, y: x > y, seq, seq[1:]))  
+
+def deepRun(model, length):
+  '''
+  Lay out a face up circular run of clubs of the given length (at most 26)
+  in waste pile 0, and return it.
+  '''
+  clubs = [card for card in model.cards if card.suit == 'club']
+  clubs.sort(key = lambda card: (card.back, -card.rank))
+  run = clubs[:length]
+  model.reset(True, True)
+  for pile in model.piles:
+    pile.clear()
+  for card in run:
+    model.up[card.code] = 1
+  model.waste[0].extend(run)
+  model.updateAllRuns()
+  return run
+
+def randomGame(model, seed, length = GAME_LENGTH):
+  '''
+  Deal the game with the given deal ID and play up to length random legal
+  moves, dealing when there are none.  Return the moves, as in 
+  Model.legalMoves, or DEAL.  The model is left at the end of the game.
+  '''
+  model.deal(False, False, seed)
+  model.rng.seed(seed)
+  moves = []
+  while len(moves) < length:
+    legal = model.legalMoves()
+    if legal:
+      move = model.rng.choice(legal)
+      model.move(*move)
+    elif model.stock and model.canDeal():
+      move = DEAL
+      model.dealUp()
+    else:
+      break
+    moves.append(move)
+  return moves
+
+def playMoves(model, seed, moves):
+  '''
+  Deal the game again and make the moves the way the view does, 
+  through grab, canDrop and selectionToWaste
+  '''
+  model.deal(False, False, seed)
+  for move in moves:
+    if move == DEAL:
+      model.dealUp()
+      continue
+    source, idx, dest = move
+    model.grab(source, idx)
+    if dest >= 10:
+      model.selectionToFoundation(dest-10)
+    elif model.canDrop(dest):
+      model.selectionToWaste(dest)
+
+def runCheck():
+  '''
+  Checking a deep run: comparing cards versus looking up the successor table
+  '''
+  model = Model(0)
+  results = {}
+  for length in (13, 26):
+    run = deepRun(model, length)
+    compared = [ComparedCard(card) for card in run]
+    assert comparedDescending(compared) and Card.isDescending(run)
+    results['compared%d' % length] = best(lambda: comparedDescending(compared))
+    results['table%d' % length] = best(lambda: Card.isDescending(run))
+    results['runIndex%d' % length] = best(lambda: model.updateRuns(0, 0))
+  return results
+
+def modelDeal():
+  '''
+  Dealing a game
+  '''
+  model = Model(0)
+  seeds = iter(range(10**9))
+  return {'deal': best(lambda: model.deal(seed = next(seeds)))}
+
+def modelMoves():
+  '''
+  Playing a game of GAME_LENGTH moves the way the view does, per move,
+  and listing the legal moves
+  '''
+  model = Model(0)
+  moves = randomGame(model, 1)
+  return {'move': best(lambda: playMoves(model, 1, moves)) / len(moves),
+          'legalMoves': best(model.legalMoves)}
+
+def modelUndoRedo():
+  '''
+  Undoing a whole game, then redoing it, per move
+  '''
+  model = Model(0)
+  n = len(randomGame(model, 2))
+  def storm():
+    while model.canUndo():
+      model.undo()
+    while model.canRedo():
+      model.redo()
+  return {'undoRedo': best(storm) / (2*n)}
+
+def modelRestart():
+  '''
+  Restarting and redealing at the end of a game, and going back to the end
+  '''
+  model = Model(0)
+  n = len(randomGame(model, 3))
+  def end():
+    model.jumpTo(n)
+  return {'restart': best(model.restart, setup = end),
+          'redeal': best(model.redeal, setup = end),
+          'jumpToEnd': best(end, setup = model.restart)}
+
+def modelStatus():
+  '''
+  The status queries made after every move
+  '''
+  model = Model(0)
+  randomGame(model, 4)
+  return {'completeSuit': best(lambda: [model.completeSuit(k) for k in range(10)]) / 10,
+          'downCards': best(model.downCards)}
+
+def simulateGreedy():
+  '''
+  Laying out a deal as a State, and playing games with the greedy policy
+  as simulate does, per game, in plain and in open circular spider
+  '''
+  seeds = iter(range(10**9))
+  results = {'stateDeal': best(lambda: State.deal(next(seeds)))}
+  for name, circular, open in (('greedy', False, False), ('greedyOpenCircular', True, True)):
+    def games(circular = circular, open = open):
+      for result in simulate.simulate(GREEDY_GAMES, simulate.greedyPolicy, circular, open, seed = 0):
+        pass
+    results[name] = best(games) / GREEDY_GAMES
+  return results
+
+def rates(results, target = simulate.TARGET_RATE):
+  '''
+  Print the games a minute of each greedy game time against the target
+  rate.  Return the names of those that fall short of it.
+  '''
+  short = []
+  for key, value in results.items():
+    if key.startswith('simulate.greedy'):
+      rate = 60e6 / value
+      flag = ''
+      if rate < target:
+        short.append(key)
+        flag = '  BELOW TARGET'
+      print('%-28s %10.0f games/min  target %d%s' % (key, rate, target, flag))
+  return short
+
+@contextlib.contextmanager
+def display():
+  '''
+  Make sure there is an X display, starting Xvfb if there is none.
+  Yield whether there is one.
+  '''
+  if os.environ.get('DISPLAY'):
+    yield True
+    return
+  if not shutil.which('Xvfb'):
+    yield False
+    return
+  server = subprocess.Popen(['Xvfb', XVFB_DISPLAY, '-screen', '0', '1280x1024x24'],
+                            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+  socket = '/tmp/.X11-unix/X' + XVFB_DISPLAY[1:]
+  deadline = time.perf_counter() + XVFB_WAIT
+  while not os.path.exists(socket) and time.perf_counter() < deadline:
+    time.sleep(0.05)
+  os.environ['DISPLAY'] = XVFB_DISPLAY
+  try:
+    yield server.poll() is None
+  finally:
+    del os.environ['DISPLAY']
+    server.terminate()
+    server.wait()
+
+def makeView():
+  '''
+  Make a View of a game 100 moves along, with the window drawn
+  '''
+  from view import View
+  model = Model(0)
+  randomGame(model, 5, 100)
+  parent = SimpleNamespace(model = model)
+  view = View(parent, lambda: None, width = 1000, height = 1000, scrollregion = (0, 0, 950, 3000))
+  view.root.update()
+  return view
+
+def viewShow(view):
+  '''
+  Redrawing everything, as after a new deal, and redrawing after one move
+  '''
+  model = view.model
+  root = view.root
+  def full():
+    view.placed[:] = [None] * 104
+    view.shown[:] = [None] * 104
+    view.stacked = [[] for pile in model.piles]
+    view.status.clear()
+    model.dirty.update(range(len(model.piles)))
+    view.show()
+    root.update_idletasks()
+  def step():
+    model.undo()
+    view.show()
+    model.redo()
+    view.show()
+    root.update_idletasks()
+  return {'fullShow': best(full), 'moveShow': best(step) / 2}
+
+def viewDrag(view, steps = 60):
+  '''
+  Dragging the longest run on the tableau back and forth, per frame
+  '''
+  model = view.model
+  root = view.root
+  k = max(range(10), key = lambda k: model.runs[k][-1] if model.waste[k] else 0)
+  idx = len(model.waste[k]) - max(1, model.runs[k][-1])
+  x, y = view.placed[model.waste[k][idx].code]
+  y -= int(view.tableau.canvas.canvasy(0))
+  def drag():
+    selection = model.grab(k, idx)
+    view.grab(selection, k, x, y)
+    for n in range(steps):
+      view.drag(SimpleNamespace(x = x + 5*(n % 20), y = y))
+      view.flushDrag()
+    root.update_idletasks()
+    view.abortMove()
+  return {'dragFrame': best(drag) / steps}
+
+def viewBenchmarks():
+  '''
+  Run the view benchmarks; there must be an X display
+  '''
+  view = makeView()
+  try:
+    results = viewShow(view)
+    results.update(viewDrag(view))
+  finally:
+    view.root.destroy()
+  return results
+
+def reference():
+  '''
+  A fixed workload of plain Python, to gauge the speed of the machine
+  '''
+  data = list(range(1000))
+  return best(lambda: sorted(data, key = lambda x: -x))
+
+BENCHMARKS = {'runCheck': runCheck,
+              'deal': modelDeal,
+              'moves': modelMoves,
+              'undoRedo': modelUndoRedo,
+              'restart': modelRestart,
+              'status': modelStatus,
+              'simulate': simulateGreedy,
+              'view': viewBenchmarks}
+REFERENCE = 'reference'      # name of the reference time, in the results of each benchmark and of the run
+
+def runBenchmark(name):
+  '''
+  Run one benchmark in this interpreter, and return its times, with the
+  best time of the reference workload, run just before and just after it
+  '''
+  gc.collect()
+  before = reference()
+  results = BENCHMARKS[name]()
+  results[REFERENCE] = min(before, reference())
+  return results
+
+def runIsolated(name):
+  '''
+  Run one benchmark in a fresh interpreter, and return its times
+  '''
+  command = [sys.executable, os.path.abspath(__file__), '--worker', name]
+  output = subprocess.run(command, check = True, stdout = subprocess.PIPE, text = True).stdout
+  return json.loads(output)
+
+def compare(results, baseline, threshold, floor = NOISE_FLOOR):
+  '''
+  Print each time beside its baseline, scaled by the change in the REFERENCE
+  time.  Return the names of the times that have grown by more than the
+  threshold, as a fraction, and by more than floor microseconds.
+  '''
+  scale = 1.0
+  if results.get(REFERENCE) and baseline.get(REFERENCE):
+    scale = results[REFERENCE] / baseline[REFERENCE]
+    print('machine speed: baseline times scaled by %.2f' % scale)
+  regressions = []
+  for name, new in results.items():
+    old = baseline.get(name)
+    if old is None or name == REFERENCE:
+      continue
+    old *= scale
+    change = new/old - 1 if old else 0.0
+    flag = ''
+    if change > threshold and new - old > floor:
+      regressions.append(name)
+      flag = '  REGRESSION'
+    print('%-24s %10.2f us  baseline %10.2f us  %+6.1f%%%s' % (name, new, old, 100*change, flag))
+  return regressions
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Benchmark spider solitaire')
+  parser.add_argument('names', nargs = '*', metavar = 'name',
+                      help = 'benchmarks to run, all by default: %s' % ', '.join(BENCHMARKS))
+  parser.add_argument('--save', metavar = 'FILE', help = 'save the times as a JSON baseline')
+  parser.add_argument('--baseline', metavar = 'FILE', help = 'compare the times with a JSON baseline')
+  parser.add_argument('--threshold', type = float, default = THRESHOLD,
+                      help = 'slowdown counted as a regression, as a fraction of the baseline')
+  parser.add_argument('--rounds', type = int, default = ROUNDS,
+                      help = 'times to run the benchmarks, keeping the median')
+  parser.add_argument('--floor', type = float, default = NOISE_FLOOR,
+                      help = 'slowdown in microseconds too small to count as a regression')
+  parser.add_argument('--worker', metavar = 'NAME', help = argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+  if args.worker:
+    print(json.dumps(runBenchmark(args.worker)))
+    return
+  for name in args.names:
+    if name not in BENCHMARKS:
+      parser.error('unknown benchmark %s' % name)
+
+  ratios = {}
+  references = []
+  names = args.names or list(BENCHMARKS)
+  with display() if 'view' in names else contextlib.nullcontext(True) as ok:
+    if not ok:
+      print('no X display and no Xvfb: view benchmarks skipped')
+      names.remove('view')
+    for r in range(args.rounds):
+      for name in names:
+        times = runIsolated(name)
+        reference = times.pop(REFERENCE)
+        references.append(reference)
+        for key, value in times.items():
+          ratios.setdefault('%s.%s' % (name, key), []).append(value / reference)
+  scale = statistics.median(references)
+  results = {key: scale * statistics.median(values) for key, values in ratios.items()}
+  results[REFERENCE] = scale
+  for name in names:
+    print(name)
+    for key, value in results.items():
+      if key.startswith(name + '.'):
+        print('  %-22s %10.2f us' % (key[len(name)+1:], value))
+  if 'simulate' in names:
+    print()
+    rates(results)
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent = 2, sort_keys = True)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    print()
+    regressions = compare(results, baseline, args.threshold, args.floor)
+    if regressions:
+      print('%d regressions: %s' % (len(regressions), ', '.join(regressions)))
+      sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,91 @@
+# hint.py
+'''
+Hints for the player.  The best move is looked for in a worker process,
+working on a model of its own set up from a snapshot of the position, so
+the event loop never waits for it, and doesn't compete with it for the
+interpreter, and the player can go on playing while it runs.  The view
+polls for the answer with root.after, and cancels the search as soon as
+the position changes, which ends the process at once.  The process is
+spawned, not forked, since a fork would inherit the Tcl interpreter and
+the X connection of the window, and Tk does not survive that.
+'''
+import multiprocessing
+from model import Model, DEAL
+from solver import Solver
+from simulate import searchPolicy
+
+HINT_TIME = 2.0       # seconds the solver may search for a hint
+HINT_MEMORY = 16      # transposition table budget in megabytes
+CONTEXT = multiprocessing.get_context('spawn')
+
+def findMove(model, timeLimit = HINT_TIME):
+  '''
+  Return the move to suggest in the position of model, as in Model.legalMoves,
+  or DEAL, or None if there is nothing useful to do.
+  In an open game, the solver looks for a win within timeLimit seconds,
+  and the hint is the first move of the win.  Otherwise, the hint is the
+  move the search policy of simulate.py would make; the solver isn't used
+  in a closed game, since it would look at the face down cards.
+  '''
+  if model.win():
+    return None
+  if model.open:
+    solution = Solver(model, HINT_MEMORY, timeLimit = timeLimit).solve()
+    if solution:
+      return solution[0]
+  plan = searchPolicy(model, {model.hash})
+  if plan:
+    return plan[0]
+  if model.stock and model.canDeal():
+    return DEAL
+  return None
+
+def work(state, circular, open, timeLimit, conn):
+  '''
+  The worker process: set up the position in state, and send back the move
+  '''
+  model = Model()
+  model.reset(circular, open)
+  model.restore(state)
+  model.checkpoints = [(0, model.snapshot())]
+  conn.send(findMove(model, timeLimit))
+  conn.close()
+
+class Hint:
+  '''
+  Search for a move in the current position of model.
+  Once poll returns true, move is the move found, as findMove returns it.
+  '''
+  def __init__(self, model, timeLimit = HINT_TIME):
+    self.move = None
+    self.done = False
+    self.receiver, sender = CONTEXT.Pipe(duplex = False)
+    args = (model.snapshot(), model.circular, model.open, timeLimit, sender)
+    self.process = CONTEXT.Process(target = work, args = args, daemon = True)
+    self.process.start()
+    sender.close()
+
+  def poll(self):
+    '''
+    Has the search finished?  If the worker died without an answer,
+    the search counts as finished, with no move.
+    '''
+    if not self.done and self.receiver.poll():
+      try:
+        self.move = self.receiver.recv()
+      except EOFError:
+        self.move = None
+      self.done = True
+      self.receiver.close()
+      self.process.join()
+    return self.done
+
+  def cancel(self):
+    '''
+    Abandon the search, ending the worker process
+    '''
+    if not self.done:
+      self.done = True
+      self.process.terminate()
+      self.receiver.close()
+      self.process.join()
@@ -0,0 +1,157 @@
+# history.py
+'''
+The history of games played, kept in a SQLite database.  Each game is
+appended when it is finished or abandoned, with its deal ID, variant,
+number of moves, cards left face down, and whether it was won.
+
+A trigger keeps running totals for each variant as games are added, so
+the statistics come from a table of at most four rows, however many games
+are stored, and nothing is scanned at startup.  The games themselves are
+indexed by variant and by deal ID.
+
+Run "python history.py" to print the statistics, or with --import to add
+the games in files written by record.py.
+'''
+import os, time, sqlite3, argparse
+from collections import namedtuple
+
+PATH = os.environ.get('SPIDER_HISTORY') or os.path.join(os.path.expanduser('~'), '.spider_history.db')
+
+SCHEMA = '''
+create table if not exists games (
+  id integer primary key,
+  dealId integer not null,      -- stored signed; see toSigned
+  circular integer not null,
+  open integer not null,
+  moves integer not null,
+  down integer not null,
+  won integer not null,
+  played real not null          -- seconds since the epoch
+);
+create index if not exists gamesByVariant on games (circular, open, won);
+create index if not exists gamesByDeal on games (dealId);
+create table if not exists totals (
+  circular integer not null,
+  open integer not null,
+  games integer not null,
+  wins integer not null,
+  moves integer not null,
+  down integer not null,
+  primary key (circular, open)
+);
+create trigger if not exists addTotals after insert on games
+begin
+  insert or ignore into totals values (new.circular, new.open, 0, 0, 0, 0);
+  update totals set games = games + 1, wins = wins + new.won,
+                    moves = moves + new.moves, down = down + new.down
+    where circular = new.circular and open = new.open;
+end;
+'''
+
+Stats = namedtuple('Stats', 'circular open games wins moves down')
+
+def toSigned(dealId):
+  # SQLite integers are signed 64-bit, and deal IDs are unsigned
+  return dealId - 2**64 if dealId >= 2**63 else dealId
+
+def fromSigned(value):
+  return value + 2**64 if value < 0 else value
+
+class History:
+  '''
+  The games played, in the database at path
+  '''
+  def __init__(self, path = PATH):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.executescript(SCHEMA)
+
+  def close(self):
+    self.db.close()
+
+  def row(self, model, moves, played):
+    return (toSigned(model.dealId), int(model.circular), int(model.open), moves,
+            model.downCards(), int(model.win()), played)
+
+  def add(self, model):
+    '''
+    Append the game in model, as it stands
+    '''
+    with self.db:
+      self.db.execute('insert into games (dealId, circular, open, moves, down, won, played) '
+                      'values (?, ?, ?, ?, ?, ?, ?)', self.row(model, model.moves(), time.time()))
+
+  def addMany(self, rows):
+    '''
+    Append many games at once, given as rows made by row
+    '''
+    with self.db:
+      self.db.executemany('insert into games (dealId, circular, open, moves, down, won, played) '
+                          'values (?, ?, ?, ?, ?, ?, ?)', rows)
+
+  def stats(self):
+    '''
+    Return the Stats of each variant played, normal before circular,
+    and closed before open
+    '''
+    rows = self.db.execute('select circular, open, games, wins, moves, down from totals '
+                           'order by circular, open')
+    return [Stats(bool(c), bool(o), *rest) for c, o, *rest in rows]
+
+  def recent(self, n):
+    '''
+    Return the last n games played, latest first, as tuples
+    (dealId, circular, open, moves, down, won, played)
+    '''
+    rows = self.db.execute('select dealId, circular, open, moves, down, won, played from games '
+                           'order by id desc limit ?', (n,))
+    return [(fromSigned(d), bool(c), bool(o), m, down, bool(w), p) for d, c, o, m, down, w, p in rows]
+
+  def deal(self, dealId):
+    '''
+    Return the number of times the deal has been played, and won
+    '''
+    return self.db.execute('select count(*), coalesce(sum(won), 0) from games where dealId = ?',
+                           (toSigned(dealId),)).fetchone()
+
+def variantName(stats):
+  return '%s %s' % ('Circular' if stats.circular else 'Normal', 'open' if stats.open else 'closed')
+
+def report(stats):
+  '''
+  Return lines of text showing stats, a list of Stats
+  '''
+  lines = ['%-16s %8s %8s %7s %7s %7s' % ('', 'Games', 'Won', 'Rate', 'Moves', 'Down')]
+  for s in stats:
+    lines.append('%-16s %8d %8d %6.1f%% %7.1f %7.1f' %
+                 (variantName(s), s.games, s.wins, 100*s.wins/s.games, s.moves/s.games, s.down/s.games))
+  return lines
+
+def importRows(history, paths):
+  '''
+  Replay the games in the files written by record.py, and yield their rows
+  '''
+  import record
+  now = time.time()
+  for model in record.replayAll(paths):
+    yield history.row(model, model.moves(), now)
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Statistics of the spider games played')
+  parser.add_argument('--db', default = PATH, help = 'history database')
+  parser.add_argument('--import', dest = 'files', nargs = '+', metavar = 'FILE', default = [],
+                      help = 'add the games in files written by record.py')
+  args = parser.parse_args(argv)
+
+  history = History(args.db)
+  if args.files:
+    history.addMany(importRows(history, args.files))
+  start = time.perf_counter()
+  stats = history.stats()
+  elapsed = time.perf_counter() - start
+  print('\n'.join(report(stats)))
+  print('queried in %.2f ms' % (1000*elapsed))
+  history.close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,173 @@
+# instrument.py
+'''
+Optional instrumentation of the view, to find out where the time goes
+when the game feels slow.  spider.pyw turns it on when started with
+--instrument, or with SPIDER_INSTRUMENT set in the environment.
+
+Each of the HANDLERS of the View records its latency in a histogram,
+along with the number of Tk calls it made.  The calls are counted by a
+proxy put in place of the Tcl interpreter of every widget.  The session
+can also be profiled with cProfile, and the statistics dumped to a file
+to be read with pstats.
+'''
+import time, bisect, cProfile, functools
+
+HANDLERS = ('onClick', 'drag', 'dragFrame', 'onDrop', 'undo', 'redo', 'show')
+BUCKETS = (0.5, 1, 2, 4, 8, 16, 33, 67, 133)    # upper bounds of the histogram buckets, in ms
+
+class CountingTk:
+  '''
+  Stands in for the Tcl interpreter, counting the calls made through it
+  '''
+  def __init__(self, interp):
+    self.interp = interp
+    self.calls = 0
+
+  def call(self, *args):
+    self.calls += 1
+    return self.interp.call(*args)
+
+  def __getattr__(self, name):
+    return getattr(self.interp, name)
+
+class Histogram:
+  '''
+  Latencies of one handler, in milliseconds, counted in BUCKETS,
+  with the number of Tk calls it made
+  '''
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.counts = [0] * (len(BUCKETS) + 1)
+    self.n = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.tkCalls = 0
+    self.maxTkCalls = 0
+
+  def add(self, ms, tkCalls):
+    self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+    self.n += 1
+    self.total += ms
+    self.max = max(self.max, ms)
+    self.tkCalls += tkCalls
+    self.maxTkCalls = max(self.maxTkCalls, tkCalls)
+
+  def percentile(self, p):
+    '''
+    Return the upper bound of the bucket holding the p-th percentile
+    '''
+    rank = p * self.n / 100
+    seen = 0
+    for bound, count in zip(BUCKETS, self.counts):
+      seen += count
+      if seen >= rank:
+        return bound
+    return self.max
+
+  def summary(self):
+    if not self.n:
+      return 'no calls'
+    return ('%6d calls  mean %7.2f  p50 <=%4g  p90 <=%4g  p99 <=%4g  max %7.2f ms  '
+            'Tk calls mean %5.1f max %d' %
+            (self.n, self.total/self.n, self.percentile(50), self.percentile(90),
+             self.percentile(99), self.max, self.tkCalls/self.n, self.maxTkCalls))
+
+  def bars(self):
+    lows = (0,) + BUCKETS
+    lines = []
+    for low, high, count in zip(lows, BUCKETS + (None,), self.counts):
+      if count:
+        label = '%g-%g ms' % (low, high) if high else '>%g ms' % low
+        lines.append('    %-12s %6d %s' % (label, count, '#' * round(40 * count / self.n)))
+    return lines
+
+class Instruments:
+  '''
+  Latency histograms for the handlers of the view, Tk call counts,
+  and a profiler that can be started and stopped.
+  '''
+  def __init__(self):
+    self.histograms = {name: Histogram() for name in HANDLERS}
+    self.recording = True
+    self.counter = None
+    self.profiler = None
+
+  def install(self, cls):
+    '''
+    Replace the HANDLERS of the class cls with timed versions.  This must be
+    done before the view is made, since it binds its handlers to events then.
+    '''
+    for name in HANDLERS:
+      setattr(cls, name, self.timed(name, getattr(cls, name)))
+
+  def timed(self, name, method):
+    histogram = self.histograms[name]
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+      if not self.recording:
+        return method(*args, **kwargs)
+      counter = self.counter
+      calls = counter.calls if counter else 0
+      start = time.perf_counter()
+      try:
+        return method(*args, **kwargs)
+      finally:
+        elapsed = 1000 * (time.perf_counter() - start)
+        histogram.add(elapsed, counter.calls - calls if counter else 0)
+    return wrapper
+
+  def attach(self, root):
+    '''
+    Count the Tk calls made by root and all the widgets in it,
+    and by any widgets made in them later
+    '''
+    self.counter = CountingTk(root.tk)
+    widgets = [root]
+    while widgets:
+      widget = widgets.pop()
+      widget.tk = self.counter
+      widgets.extend(widget.children.values())
+
+  def reset(self):
+    '''
+    Clear the histograms in place, since the timed handlers hold them
+    '''
+    for histogram in self.histograms.values():
+      histogram.clear()
+
+  def profiling(self):
+    return self.profiler is not None
+
+  def startProfile(self):
+    if self.profiler is None:
+      self.profiler = cProfile.Profile()
+      self.profiler.enable()
+
+  def stopProfile(self, path = None):
+    '''
+    Stop profiling, and dump the statistics to the file at path, if given
+    '''
+    if self.profiler is None:
+      return
+    self.profiler.disable()
+    if path:
+      self.profiler.dump_stats(path)
+    self.profiler = None
+
+  def dumpProfile(self, path):
+    '''
+    Dump the statistics so far to the file at path, and go on profiling
+    '''
+    if self.profiler is not None:
+      self.profiler.dump_stats(path)
+      self.profiler.enable()      # dump_stats disables the profiler
+
+  def report(self):
+    lines = []
+    for name in HANDLERS:
+      histogram = self.histograms[name]
+      lines.append('%-10s %s' % (name, histogram.summary()))
+      lines.extend(histogram.bars())
+    return '\n'.join(lines)
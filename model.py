@@ -1,6 +1,7 @@
 # model.py Model for spider solitaire
 
 import random, itertools
+from state import State, shuffled
 
 ACE = 1
 JACK = 11
@@ -17,6 +18,40 @@ RANKNAMES = ["", "Ace"] + list(map(str, range(2, 11))) + ["Jack", "Queen", "King
 COLORNAMES = ("red", "blue")     # back colors
 
 DEAL = (0, 0, 10, 0)     # used in undo/redo stacks
+STOCK = 18               # pile number of the stock; see Model.piles
+
+# Zobrist keys for position hashing.  A position is determined by what each card
+# lies on (another card, or the bottom of a pile) and whether it is face up,
+# so there is a random 64-bit key for each such combination:
+#     ZOBRIST[code][2*below + up]
+# where below is the code of the card underneath, or BOTTOM + the pile number.
+# Moving a run changes only what its bottom card lies on, so the hash of
+# a position is updated in constant time.  The keys come from a fixed seed,
+# so hashes are the same from one run to the next.
+
+BOTTOM = 104
+def zobristKeys():
+  rng = random.Random(0x5b1de7)
+  return [[rng.getrandbits(64) for k in range(2*(BOTTOM+19))] for code in range(104)]
+ZOBRIST = zobristKeys()
+
+# Successor tables.  SUCCESSORS[circular][104*a + b] is 1 if card b is the successor 
+# of card a, that is, if a can lie on b in a run: same suit, and b one rank higher,
+# or in circular mode, a King and b an Ace.  Runs are checked by looking up 
+# pairs of codes, rather than by comparing card attributes.
+
+def successorTable(circular):
+  table = bytearray(104*104)
+  for a, b in itertools.product(range(104), repeat=2):
+    if (a % 52) // 13 != (b % 52) // 13:
+      continue
+    rank, other = a % 13 + 1, b % 13 + 1
+    if other - rank == 1 or (circular and rank == KING and other == ACE):
+      table[104*a + b] = 1
+  return table
+SUCCESSORS = (successorTable(False), successorTable(True))
+
+CHECKPOINT_INTERVAL = 20   # moves between snapshots of the position; see Model.checkpoints
 
 class Stack(list):
   '''
@@ -25,18 +60,12 @@ class Stack(list):
   classes deal with presentation.
   
   The stack knows what cards it contains, but the card does not know which stack it is in.
+  Whether a card is face up is recorded by the model, not the card or the stack.
   
   In reading the code you should realize that > and < for cards indicate successor and
   predecessor, so that Ace of Hearts < Two of Hearts, but no other card.
   '''
-  def __init__(self):
-    # Bottom card is self[0]; top is self[-1]
-    super().__init__()
-        
-  def add(self, card, faceUp = True):
-    self.append(card)
-    if faceUp:
-      self[-1].showFace()
+  __slots__ = ()
         
   def isEmpty(self):
     return not self
@@ -57,35 +86,10 @@ class Stack(list):
 class SelectableStack(Stack):
   '''
   A stack from which cards can be chosen, if they are face up and in sequence,
-  from the top of the stack.  When cards are removed, the top card is automatically
-  turned up, if it is not laready face up.
+  from the top of the stack; see Model.canSelect.  When cards are removed, the 
+  top card is automatically turned up, if it is not laready face up.
   '''
-  def __init__(self):
-    super().__init__()
-    
-  def grab(self, n):
-    '''
-    Remove the card at index k and all those on top of it.
-    '''    
-    answer = self[k:]
-    self = self[:k]
-    return answer
-        
-  def replace(self, cards):
-    '''
-    Move aborted.  Replace these cards on the stack.
-    '''
-    self.extend(cards)
-    self.moving = None
-    
-  def canSelect(self, idx):
-    if idx >= len(self):
-      return False
-    if self[idx].faceDown():
-      return False
-    if not Card.isDescending(self[idx:]):
-      return False
-    return True
+  __slots__ = ()
       
 class OneWayStack(Stack):
   '''
@@ -93,52 +97,36 @@ class OneWayStack(Stack):
   No cards can be selected.
   Cards are either all face up, or all face down.
   '''
+  __slots__ = ('faceUp',)
+
   def __init__(self, faceUp):
     super().__init__()
     self.faceUp = faceUp
-    
-  def add(self, card):
-    super().add(card, self.faceUp)
 
 class Card:
   '''
   A card is identified by its rank, suit, and back color.
-  A card knows whether it is face up or own, but does not know 
-  which stack it is in.
-  The peek attribute is true if the card has been turned up by
-  "peeking," that is, by choosing the "open" option.  If the "open"
-  option is turned off, then cards that are face up only because they
-  were peeked at will be turned down.
+  Cards are immutable flyweights: there is just one Card object for each
+  of the 104 codes, in CARDS, shared by every model.  A card knows neither
+  which stack it is in nor whether it is face up; the model keeps track 
+  of both.
   '''
+  __slots__ = ('rank', 'suit', 'back', 'code')
   circular = False
   def __init__(self, rank, suit, back):
-    self.rank = rank
-    self.suit = suit
-    self.back = back
-    self.up = False   # all cards are initially face down
-    self.peek = False
-    self.code = 52*COLORNAMES.index(back)+13*SUITNAMES.index(suit)+rank-1  
-
-  def showFace(self):
-    self.up = True
-    
-  def showBack(self):
-    self.up = False
-    
-  def faceUp(self):
-    return self.up
-  
-  def faceDown(self):
-    return not self.faceUp()
+    init = super().__setattr__
+    init('rank', rank)
+    init('suit', suit)
+    init('back', back)
+    init('code', 52*COLORNAMES.index(back)+13*SUITNAMES.index(suit)+rank-1)
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Card is immutable')
   
   # Overloaded operators for predecessor and successor
   
   def __lt__(self, other):
-    if self.suit != other.suit:
-      return False
-    answer = (self.rank == other.rank-1 or 
-              (self.circular and self.rank == KING and other.rank == ACE))
-    return answer 
+    return SUCCESSORS[self.circular][104*self.code + other.code] == 1
   
   def __gt__(self, other):
     return other < self
@@ -154,7 +142,16 @@ class Card:
     '''
     Are the cards in a descending sequence of the same suit?
     '''
-    return all(map(lambda x, y: x > y, seq, seq[1:]))  
+    successors = SUCCESSORS[Card.circular]
+    return all(successors[104*a.code + b.code] for b, a in zip(seq, seq[1:]))
+
+def createCards():
+  cards = [None] * 104
+  for rank, suit, back in itertools.product(ALLRANKS, SUITNAMES, COLORNAMES):
+    card = Card(rank, suit, back)
+    cards[card.code] = card
+  return tuple(cards)
+CARDS = createCards()     # the cards, by code
 
 class Model:
   '''
@@ -167,14 +164,46 @@ class Model:
       n is the number of cards moved, 
       f is a boolean indicating whether or not the top card of the source stack is flipped,
       except that the entry (0, 0, 10, 0) connotes dealing a row of cards. 
-    '''
-  def __init__(self):
-    random.seed()
-    self.deck = []
+  self.piles lists every stack by that same number, with the stock last, as number 18.
+  self.cards lists the cards by code.  They are the shared flyweights in CARDS, so the
+  face-up state of card number code is kept in the model, as self.up[code].  If the card 
+  is face up only because of "peeking," that is, because the "open" option was chosen,
+  self.peek[code] is also set, and the card will be turned down if the option is turned off.
+  Each deal is identified by a 64-bit deal ID, self.dealId, which seeds the shuffle, so 
+  deal(seed=dealId) recreates the layout exactly.  Unless a deal ID is given, it is drawn
+  from self.rng, a random generator private to the model, seeded by the seed argument.
+  self.checkpoints is a list of pairs (n, state), in increasing order of n, where state
+  is a snapshot of the position after the first n entries of the undo stack.  There
+  is one at each deal, and one every CHECKPOINT_INTERVAL entries, so that restart, 
+  redeal and jumpTo restore the nearest one and replay only the remaining entries.
+  self.pileOf[code] and self.indexOf[code] give the pile number and position of each
+  card, kept up to date by every move, so cards are located without searching.
+  self.downCount and self.moveCount hold the number of face down cards in the waste piles 
+  and the number of moves (not deals) on the undo stack, kept up to date as they change.
+  self.dirty is the set of numbers of the piles changed since the last call to takeDirty,
+  so that the view need only redraw those.
+  self.hash is the Zobrist hash of the position, updated with every change.
+  self.dealOptions is the pair (circular, open) the game was dealt with, and
+  self.optionChanges lists the changes made to them since, as tuples (n, circular, open),
+  meaning the options were changed after the first n entries of the undo stack, so
+  that a record of the game can make them again at the same points.
+  self.runs[k][i] is the length of the face-up, same-suit, descending run ending
+  with card i of waste pile k (0 if the card is face down), so the run on top of 
+  the pile is self.runs[k][-1].  Every change to a waste pile keeps it up to date.
+  self.pairs[k][d] is 1 if some cards can be moved from waste pile k to waste pile d,
+  or, when d is k, to a foundation, and self.pairCount is the number of such pairs.
+  updateRuns notes each waste pile that changes in self.unchecked, and checkMoves 
+  brings only the pairs involving those piles up to date, so stuck is cheap.
+    '''
+  def __init__(self, seed = None):
+    self.rng = random.Random(seed)
+    self.cards = CARDS
+    self.deck = list(CARDS)
+    self.up = bytearray(104)
+    self.peek = bytearray(104)
     self.selection = []
     self.undoStack = []
     self.redoStack = []
-    self.createCards()
     self.stock = OneWayStack(False)
     self.foundations = []
     for k in range(8):
@@ -182,6 +211,16 @@ class Model:
     self.waste = []
     for k in range(10):
       self.waste.append(SelectableStack()) 
+    self.piles = self.waste + self.foundations + [self.stock]
+    self.runs = [[] for k in range(10)]
+    self.pileOf = bytearray(104)
+    self.indexOf = bytearray(104)
+    self.dirty = set(range(len(self.piles)))
+    self.circular = False
+    self.successors = SUCCESSORS[False]
+    self.pairs = [bytearray(10) for k in range(10)]
+    self.pairCount = 0
+    self.unchecked = set(range(10))
     self.deal()
     
   def shuffle(self):
@@ -190,43 +229,129 @@ class Model:
       f.clear()
     for w in self.waste:
       w.clear()
-    random.shuffle(self.deck)
-    for card in self.deck:
-      card.showBack()
+    self.dirty.update(range(len(self.piles)))
+    self.deck[:] = [self.cards[code] for code in shuffled(self.dealId)]
+    self.up[:] = bytes(104)
+    self.peek[:] = bytes(104)
     self.stock.extend(self.deck)
-      
-  def createCards(self):
-    for rank, suit, back in itertools.product(ALLRANKS, SUITNAMES, COLORNAMES):
-      self.deck.append(Card(rank, suit, back))
+
+  def faceUp(self, card):
+    return self.up[card.code] == 1
+
+  def faceDown(self, card):
+    return self.up[card.code] == 0
+
+  def copy(self):
+    '''
+    Return an independent model in the same position, with the same undo and
+    redo stacks.  The piles are copied, but the cards are shared, since they
+    are immutable.
+    '''
+    other = Model.__new__(Model)
+    other.__dict__.update(self.__dict__)
+    other.rng = random.Random()
+    other.rng.setstate(self.rng.getstate())
+    other.deck = self.deck[:]
+    other.up = self.up[:]
+    other.peek = self.peek[:]
+    other.selection = self.selection[:]
+    other.undoStack = self.undoStack[:]
+    other.redoStack = self.redoStack[:]
+    other.checkpoints = self.checkpoints[:]
+    other.optionChanges = self.optionChanges[:]
+    other.stock = OneWayStack(False)
+    other.stock.extend(self.stock)
+    other.foundations = []
+    for f in self.foundations:
+      other.foundations.append(OneWayStack(True))
+      other.foundations[-1].extend(f)
+    other.waste = [SelectableStack(w) for w in self.waste]
+    other.piles = other.waste + other.foundations + [other.stock]
+    other.runs = [r[:] for r in self.runs]
+    other.pileOf = self.pileOf[:]
+    other.indexOf = self.indexOf[:]
+    other.dirty = set(self.dirty)
+    other.pairs = [p[:] for p in self.pairs]
+    other.unchecked = set(self.unchecked)
+    return other
       
   def reset(self, circular, open):
+    changed = circular != self.circular
     self.circular = Card.circular = circular
+    self.successors = SUCCESSORS[circular]
     self.open = open    
+    if changed:
+      self.updateAllRuns()
   
-  def deal(self, circular = False, open=False):
+  def deal(self, circular = False, open=False, seed = None):
+    self.dealId = self.rng.getrandbits(64) if seed is None else seed
     self.reset(circular, open)
     self.shuffle()
     self.dealDown()
-    self.dealUp()
+    self.downCount = 0 if open else 44
+    self.moveCount = 0
+    self.updateLocations()
+    self.updateAllRuns()
+    self.hash = self.computeHash()
+    self.dealUp(True)
     self.undoStack = []
     self.redoStack = []    
+    self.checkpoints = [(0, self.snapshot())]
+    self.dealOptions = (circular, open)
+    self.optionChanges = []
+
+  def changeOptions(self, circular, open):
+    '''
+    Change the options partway through a game, as the user may, and note the
+    change in self.optionChanges
+    '''
+    if (circular, open) == (self.circular, self.open):
+      return
+    self.reset(circular, open)
+    self.adjustOpen(open)
+    n = len(self.undoStack)
+    changes = self.optionChanges
+    self.trimOptionChanges(n)
+    while changes and changes[-1][0] == n:    # only the last change at n matters
+      changes.pop()
+    changes.append((n, circular, open))
+
+  def trimOptionChanges(self, n):
+    '''
+    Bring the changes of options noted after more than n entries of the undo stack 
+    back to n.  They were made before any move that has since replaced the
+    entries past n, though they were noted at the position they were made in.
+    '''
+    changes = self.optionChanges
+    for k in reversed(range(len(changes))):
+      if changes[k][0] <= n:
+        break
+      changes[k] = (n,) + changes[k][1:]
     
   def adjustOpen(self, up):
     '''
     Adjust the open mode if the user changes the option
     '''
+    faceUp, peek = self.up, self.peek
     if up:
-      for w in self.waste:
-        for card in w[:-1]:
-          if card.faceDown():
-            card.peek = True
-            card.showFace()
+      for k, w in enumerate(self.waste):
+        for i, card in enumerate(w[:-1]):
+          if not faceUp[card.code]:
+            self.hash ^= self.key(k, i)
+            peek[card.code] = faceUp[card.code] = 1
+            self.hash ^= self.key(k, i)
+            self.downCount -= 1
     else:
-      for w in self.waste:
-        for card in w[:-1]:        
-          if card.faceUp() and card.peek:
-            card.showBack()
-          card.peek = False
+      for k, w in enumerate(self.waste):
+        for i, card in enumerate(w[:-1]):        
+          if faceUp[card.code] and peek[card.code]:
+            self.hash ^= self.key(k, i)
+            faceUp[card.code] = 0
+            self.hash ^= self.key(k, i)
+            self.downCount += 1
+          peek[card.code] = 0
+    self.updateAllRuns()
+    self.dirty.update(range(10))
         
   def dealDown(self):
     '''
@@ -235,7 +360,8 @@ class Model:
     '''
     for n in range(44):
       card = self.stock.pop()
-      self.waste[n%10].add(card, self.open)
+      self.waste[n%10].append(card)
+      self.up[card.code] = self.open
       
   def dealUp(self, redo=False):
     '''
@@ -243,11 +369,20 @@ class Model:
     redo is True if we are redoing a deal
     '''
     for n in range(10):
+      self.hash ^= self.key(STOCK, len(self.stock)-1)
       card = self.stock.pop()
-      self.waste[n].add(card, True)
+      self.waste[n].append(card)
+      self.up[card.code] = 1
+      self.pileOf[card.code] = n
+      self.indexOf[card.code] = len(self.waste[n])-1
+      self.hash ^= self.key(n, len(self.waste[n])-1)
+      self.updateRuns(n, len(self.waste[n])-1)
+    self.dirty.update(range(10))
+    self.dirty.add(STOCK)
     if not redo:
       self.undoStack.append(DEAL)
       self.redoStack = []
+      self.checkpoint()
       
   def canDeal(self):
     '''
@@ -267,7 +402,7 @@ class Model:
     cards and the number of face up cards in waste[k]
     '''
     w = self.waste[k]
-    down = len([card for card in w if card.faceDown()])
+    down = len([card for card in w if not self.up[card.code]])
     return (down, len(w) - down)
   
   def grab(self, k, idx):
@@ -278,7 +413,7 @@ class Model:
     We need to remember the data, since the move may fail.
     '''
     w = self.waste[k]
-    if not w.canSelect(idx):
+    if not self.canSelect(k, idx):
       return []
     self.moveOrigin = k
     self.moveIndex = idx
@@ -316,14 +451,13 @@ class Model:
     Tranfer the moving cards to the destination stack.
     Turn the top card of the source stack face up, if need be.
     '''
-    source = self.waste[self.moveOrigin]
-    moving = self.selection
-    target = self.waste[dest] if dest < 10 else self.foundations[dest-10]
-    target.extend(self.selection)
-    source[:] = source[:self.moveIndex]
+    n = len(self.selection)
+    self.transfer(self.moveOrigin, dest, n)
     self.undoStack.append(self.flipTop(self.moveOrigin, dest, len(self.selection)))
+    self.moveCount += 1
     self.selection = []
     self.redoStack = []
+    self.checkpoint()
     
   def selectionToFoundation(self, dest):
     '''
@@ -343,9 +477,7 @@ class Model:
     downwards, on top?
     '''
     w = self.waste[pile]
-    if len(w) < 13 or w[-13].faceDown():
-      return False
-    return w[-1].rank == ACE and Card.isDescending(w[-13:])
+    return bool(w) and self.runs[pile][-1] >= 13 and w[-1].rank == ACE
   
   def firstFoundation(self):
     # return index of first empty foundation pile
@@ -359,9 +491,9 @@ class Model:
     Return appropriate undo tuple
     '''
     w = self.waste[src]
-    flip = w and w[-1].faceDown()
+    flip = bool(w) and self.faceDown(w[-1])
     if flip:
-      w[-1].showFace()
+      self.turnTop(src, True)
     return src, target, n, flip
   
   def movingCompleteSuit(self):
@@ -382,49 +514,67 @@ class Model:
     if (s, t, n, f) == DEAL:
       self.undeal()
     else:
-      if f:   # flip top card
-        self.waste[s][-1].showBack()
-      source = self.waste[s] if s < 10 else self.foundations[s-10]
-      target = self.waste[t] if t < 10 else self.foundations[t-10]
-      assert len(target) >= n
-      source.extend(target[-n:])
-      target[:] = target[:-n]
+      self.moveCount -= 1
+      if f:   # flip top card back, unless the game is open
+        if self.open:
+          self.peek[self.waste[s][-1].code] = 1
+        else:
+          self.turnTop(s, False)
+      assert len(self.piles[t]) >= n
+      self.transfer(t, s, n)
     
   def undeal(self):
     '''
     Undo a deal of a row of cards
     '''
-    for w in reversed(self.waste):
+    for k in reversed(range(10)):
+      w = self.waste[k]
       assert w
+      self.hash ^= self.key(k, len(w)-1)
       card = w.pop()
-      card.showBack()
+      self.downCount -= self.faceDown(card)
+      self.up[card.code] = 0
       self.stock.append(card)
+      self.pileOf[card.code] = STOCK
+      self.indexOf[card.code] = len(self.stock)-1
+      self.hash ^= self.key(STOCK, len(self.stock)-1)
+      self.updateRuns(k, len(w))
+    self.dirty.update(range(10))
+    self.dirty.add(STOCK)
       
   def redeal(self):
-    try:
-      while self.undoStack[-1] != DEAL:
-        self.undo()
-    except IndexError:
-      pass
-    if len(self.stock) != 50:
-      self.undo()
+    '''
+    Go back to the position before the last deal
+    '''
+    undo = self.undoStack
+    for n in reversed(range(len(undo))):
+      if undo[n] == DEAL:
+        break
+    else:       # loop else
+      n = 0
+    self.jumpTo(n)
 
   def redo(self):
     ''''
     Pop a record off the redo stack and redo the corresponding move.
     ''' 
-    (s, t, n, f) = self.redoStack.pop()
-    self.undoStack.append((s,t,n, f))
-    if (s, t, n, f) == DEAL:
+    record = self.redoStack.pop()
+    self.undoStack.append(record)
+    self.moveCount += record != DEAL
+    self.replay(record)
+
+  def replay(self, record):
+    '''
+    Make the move in an undo record, without touching the undo and redo stacks
+    '''
+    (s, t, n, f) = record
+    if record == DEAL:
       self.dealUp(True) 
     else:
-      source = self.waste[s] if s < 10 else self.foundations[s-10]
-      target = self.waste[t] if t < 10 else self.foundations[t-10]
-      assert n <= len(source)
-      target.extend(source[-n:])
-      source[:] = source[:-n]     
+      assert n <= len(self.piles[s])
+      self.transfer(s, t, n)
     if f:  # flip top card
-        self.waste[s][-1].showFace()
+        self.turnTop(s, True)
         
   def canUndo(self):
     return self.undoStack != []
@@ -433,15 +583,380 @@ class Model:
       return self.redoStack != []  
     
   def restart(self):
-    while self.canUndo():
-      self.undo()
+    self.jumpTo(0)
+
+  def checkpoint(self):
+    '''
+    A new entry has been pushed on the undo stack, and the redo stack cleared.
+    Discard the checkpoints past the current position, which can no longer be
+    reached, and take a new one if it's due.  Changes of options noted past
+    the current position were made before the new entry.
+    '''
+    n = len(self.undoStack)
+    self.trimOptionChanges(n-1)
+    checkpoints = self.checkpoints
+    while checkpoints[-1][0] >= n:
+      checkpoints.pop()
+    if self.undoStack[-1] == DEAL or n % CHECKPOINT_INTERVAL == 0:
+      checkpoints.append((n, self.snapshot()))
+
+  def trimCheckpoints(self):
+    '''
+    Discard the checkpoints past the end of the undo stack.  A checkpoint past
+    the end is only good for the moves on the redo stack, so this must be called 
+    by anything that replaces the redo stack with one of its own.
+    '''
+    n = len(self.undoStack)
+    checkpoints = self.checkpoints
+    while checkpoints[-1][0] > n:
+      checkpoints.pop()
+
+  def jumpTo(self, n):
+    '''
+    Go to the position after the first n entries of the undo stack.
+    Moves taken back are pushed on the redo stack, just as if they had 
+    been undone one at a time, and if n is past the end of the undo stack,
+    moves are redone, as far as the redo stack goes.  Either way, the 
+    nearest checkpoint at or before n is restored, if that is cheaper 
+    than stepping, and only the entries after it are replayed.  The
+    checkpoints past the end of the undo stack are kept for this.
+    '''
+    undo, redo = self.undoStack, self.redoStack
+    n = min(n, len(undo) + len(redo))
+    for length, state in reversed(self.checkpoints):
+      if length <= n:
+        break
+    if n >= len(undo):
+      if length <= len(undo):    # redoing is cheaper
+        while len(undo) < n:
+          self.redo()
+        return
+      records = redo[len(redo) - (n - len(undo)):]
+      del redo[len(redo) - len(records):]
+      undo.extend(reversed(records))
+      self.moveCount += sum(record != DEAL for record in records)
+    else:
+      if n - length >= len(undo) - n:    # undoing is cheaper
+        while len(undo) > n:
+          self.undo()
+        return
+      redo.extend(reversed(undo[n:]))
+      self.moveCount -= sum(record != DEAL for record in undo[n:])
+      del undo[n:]
+    self.restore(state)
+    self.adjustOpen(self.open)
+    for record in undo[length:]:
+      self.replay(record)
           
   def dealsLeft(self):
     return len(self.stock) // 10
   
   def moves(self):
-    return len([m for m in self.undoStack if m != DEAL])
+    return self.moveCount
   
   def downCards(self):
-    return sum([self.downUp(k)[0] for k in range(10)])
-    
\ No newline at end of file
+    return self.downCount
+
+  def transfer(self, s, t, n):
+    '''
+    Move the top n cards of pile s onto pile t, keeping the run index current.
+    Piles are numbered as in self.piles.
+    '''
+    source = self.piles[s]
+    target = self.piles[t]
+    bottom = len(source) - n
+    self.hash ^= self.key(s, bottom)
+    start = len(target)
+    target.extend(source[bottom:])
+    del source[bottom:]
+    for idx in range(start, len(target)):
+      code = target[idx].code
+      self.pileOf[code] = t
+      self.indexOf[code] = idx
+    self.hash ^= self.key(t, len(target)-n)
+    self.dirty.add(s)
+    self.dirty.add(t)
+    if s < 10:
+      self.updateRuns(s, len(source))
+    if t < 10:
+      self.updateRuns(t, len(target)-n)
+
+  def updateLocations(self):
+    for p, pile in enumerate(self.piles):
+      for idx, card in enumerate(pile):
+        self.pileOf[card.code] = p
+        self.indexOf[card.code] = idx
+
+  def locate(self, code):
+    '''
+    Return (pile, index) of the card with the given code
+    '''
+    return self.pileOf[code], self.indexOf[code]
+
+  def grabCard(self, code):
+    '''
+    Grab the card with the given code, and those on top of it,
+    if it's in a waste pile.  Return the selection, as grab does.
+    '''
+    pile, idx = self.locate(code)
+    if pile >= 10:
+      return []
+    return self.grab(pile, idx)
+
+  def turnTop(self, k, up):
+    '''
+    Turn the top card of waste pile k face up or face down
+    '''
+    w = self.waste[k]
+    self.hash ^= self.key(k, len(w)-1)
+    code = w[-1].code
+    self.downCount += self.up[code] - up
+    self.up[code] = up
+    self.peek[code] = 0
+    self.hash ^= self.key(k, len(w)-1)
+    self.updateRuns(k, len(w)-1)
+    self.dirty.add(k)
+
+  def key(self, p, i):
+    '''
+    Zobrist key of card i of pile p, in its current state
+    '''
+    pile = self.piles[p]
+    card = pile[i]
+    below = pile[i-1].code if i else BOTTOM + p
+    return ZOBRIST[card.code][2*below + self.up[card.code]]
+
+  def hashAfter(self, source, idx, dest):
+    '''
+    Return the hash the position would have after the move (source, idx, dest),
+    as returned by legalMoves, without making it.  Only what the bottom moving
+    card lies on changes, and whether the card it leaves is face up.
+    '''
+    w = self.waste[source]
+    code = w[idx].code
+    below = w[idx-1].code if idx else BOTTOM + source
+    target = self.piles[dest]
+    onto = target[-1].code if target else BOTTOM + dest
+    keys = ZOBRIST[code]
+    answer = self.hash ^ keys[2*below + 1] ^ keys[2*onto + 1]
+    if idx and not self.up[below]:
+      keys = ZOBRIST[below]
+      under = 2*w[idx-2].code if idx > 1 else 2*(BOTTOM + source)
+      answer ^= keys[under] ^ keys[under + 1]
+    return answer
+
+  def computeHash(self):
+    '''
+    Compute the hash of the position from scratch
+    '''
+    answer = 0
+    for p, pile in enumerate(self.piles):
+      for i in range(len(pile)):
+        answer ^= self.key(p, i)
+    return answer
+
+  def updateRuns(self, k, start):
+    '''
+    Recompute the run index of waste pile k from card number start up.
+    Cards below start are unchanged, so this costs O(cards added).
+    '''
+    w = self.waste[k]
+    runs = self.runs[k]
+    successors = self.successors
+    self.unchecked.add(k)
+    del runs[start:]
+    for i in range(start, len(w)):
+      card = w[i]
+      if not self.up[card.code]:
+        runs.append(0)
+      elif i and runs[i-1] and successors[104*card.code + w[i-1].code]:
+        runs.append(runs[i-1]+1)
+      else:
+        runs.append(1)
+
+  def updateAllRuns(self):
+    for k in range(10):
+      self.updateRuns(k, 0)
+
+  def canSelect(self, k, idx):
+    '''
+    Can card idx and those on top of it be picked up from waste pile k?
+    '''
+    w = self.waste[k]
+    return 0 <= idx < len(w) and len(w) - idx <= self.runs[k][-1]
+
+  def legalMoves(self, distinct = False):
+    '''
+    Return a list of all legal moves, as tuples (source, index, dest), where
+    source is a waste pile, index is the position of the bottom moving card,
+    and dest is numbered as in the undo stack: a waste pile, or 10 plus a foundation.
+    Since the ranks in a run increase by one from the top down, the card
+    that fits on a given destination is found by arithmetic, so the cost
+    does not depend on the depth of the piles.
+    If distinct is true, moves to any space but the first are left out, since 
+    the spaces are interchangeable, and so are moves of a whole pile to a space,
+    which would only exchange two piles.
+    '''
+    moves = []
+    waste = self.waste
+    circular = self.circular
+    targets = []          # (dest, rank of the card that fits on it, or 0 for a space)
+    space = False
+    for dest, target in enumerate(waste):
+      if not target:
+        if not (distinct and space):
+          targets.append((dest, 0))
+        space = True
+        continue
+      rank = target[-1].rank - 1
+      if rank < ACE:
+        if not circular:
+          continue
+        rank = KING
+      targets.append((dest, rank))
+    for k, w in enumerate(waste):
+      run = self.runs[k][-1] if w else 0
+      if not run:
+        continue
+      top = len(w) - 1
+      bottom = len(w) - run
+      if run >= 13 and w[-1].rank == ACE:
+        moves.append((k, len(w)-13, 10+self.firstFoundation()))
+      for dest, rank in targets:
+        if dest == k:
+          continue
+        if not rank:
+          first = 1 if distinct and bottom == 0 else bottom
+          moves.extend([(k, idx, dest) for idx in range(first, len(w))])
+          continue
+        offset = rank - w[-1].rank
+        if circular:
+          offset %= 13
+        elif offset < 0:
+          continue
+        idx = top - offset
+        while idx >= bottom:
+          moves.append((k, idx, dest))
+          if not circular:
+            break
+          idx -= 13
+    return moves
+
+  def move(self, source, idx, dest):
+    '''
+    Make the move (source, idx, dest) as returned by legalMoves
+    '''
+    self.grab(source, idx)
+    self.completeMove(dest)
+
+  def safeMoves(self):
+    '''
+    Return the legal moves that can't hurt: complete suits to the foundations,
+    and whole runs from the top of a pile onto a card of the same suit.
+    Each safe move leaves one fewer break in suit among the face up cards, 
+    or turns a card face up, so a series of them must come to an end.
+    '''
+    waste = self.waste
+    suits = []
+    builds = []
+    for move in self.legalMoves():
+      source, idx, dest = move
+      w = waste[source]
+      if dest >= 10:
+        suits.append(move)
+      elif waste[dest] and idx == len(w) - self.runs[source][-1] and \
+           waste[dest][-1].suit == w[idx].suit:
+        builds.append(move)
+    return suits + builds
+
+  def autoPlay(self):
+    '''
+    Make safe moves, as long as there are any, recording them on the undo 
+    stack as usual.  Return the number of moves made.
+    '''
+    count = 0
+    while True:
+      moves = self.safeMoves()
+      if not moves:
+        return count
+      self.move(*moves[0])
+      count += 1
+
+  def canMove(self, k, d):
+    '''
+    Can any cards be moved from waste pile k to waste pile d, or, if d is k,
+    to a foundation?  Like legalMoves, this works by rank arithmetic.
+    '''
+    if k == d:
+      return self.completeSuit(k)
+    w = self.waste[k]
+    run = self.runs[k][-1] if w else 0
+    if not run:
+      return False
+    target = self.waste[d]
+    if not target:
+      return True
+    rank = target[-1].rank - 1
+    if rank < ACE:
+      if not self.circular:
+        return False
+      rank = KING
+    offset = rank - w[-1].rank
+    if self.circular:
+      offset %= 13
+    return 0 <= offset < run
+
+  def checkMoves(self):
+    '''
+    Bring self.pairs up to date for the piles changed since the last call
+    '''
+    pairs = self.pairs
+    for p in self.unchecked:
+      for k in range(10):
+        for a, b in ((p, k), (k, p)):
+          fits = self.canMove(a, b)
+          if fits != pairs[a][b]:
+            pairs[a][b] = fits
+            self.pairCount += 1 if fits else -1
+    self.unchecked.clear()
+
+  def hasMoves(self):
+    '''
+    Is there any legal move, not counting a deal?
+    '''
+    self.checkMoves()
+    return self.pairCount > 0
+
+  def stuck(self):
+    '''
+    Is the game at a dead end, with no legal move and no deal?
+    A game that has been won is not.
+    '''
+    return not self.win() and not self.hasMoves() and (not self.stock or not self.canDeal())
+
+  def takeDirty(self):
+    '''
+    Return the set of piles changed since the last call, and start a new one
+    '''
+    dirty = self.dirty
+    self.dirty = set()
+    return dirty
+
+  def snapshot(self):
+    '''
+    Return the position as a compact State
+    '''
+    return State.fromModel(self)
+  
+  def restore(self, state):
+    '''
+    Set up the position recorded in state.
+    The undo and redo stacks are not affected.
+    '''
+    state.restore(self)
+    self.downCount = sum(self.downUp(k)[0] for k in range(10))
+    self.updateLocations()
+    self.updateAllRuns()
+    self.hash = self.computeHash()
+    self.dirty.update(range(len(self.piles)))
+    self.selection = []
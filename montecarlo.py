@@ -0,0 +1,139 @@
+# montecarlo.py
+'''
+Estimate the win rates of the four variants of spider solitaire, normal
+or circular, closed or open, under a playing policy from simulate.py.
+
+The deals are split into shards of consecutive deal IDs, and the shards
+are played by a pool of worker processes, one per core by default.  As
+each shard is finished, its result is appended to a results file and the
+running estimates, with confidence intervals, are printed.  If the run is
+interrupted, running it again with the same results file skips the shards
+already done.  Every variant plays the same deal IDs.
+'''
+import os, sys, json, math, time, itertools, argparse
+import multiprocessing
+from simulate import simulate, makePolicy, POLICIES, MAX_MOVES, SEARCH_BUDGET
+
+VARIANTS = tuple(itertools.product((False, True), repeat=2))   # (circular, open)
+Z = 1.96      # for 95% confidence intervals
+
+def variantName(circular, open):
+  return '%-8s %-6s' % ('circular' if circular else 'normal', 'open' if open else 'closed')
+
+def wilson(wins, games, z = Z):
+  '''
+  Return the Wilson score interval (low, high) for a proportion
+  '''
+  if not games:
+    return 0.0, 1.0
+  p = wins / games
+  denom = 1 + z*z/games
+  center = (p + z*z/(2*games)) / denom
+  half = z * math.sqrt(p*(1-p)/games + z*z/(4*games*games)) / denom
+  return max(0.0, center - half), min(1.0, center + half)
+
+def runShard(task):
+  '''
+  Play one shard in a worker process.  Return the task with the number of wins.
+  '''
+  policy = makePolicy(task['policy'], task['budget'])
+  won = sum(result.won for result in simulate(task['games'], policy, task['circular'], task['open'],
+                                              task['maxMoves'], seed = task['start']))
+  return dict(task, wins = won)
+
+def shardKey(task):
+  return (task['policy'], task['budget'], task['maxMoves'], task['circular'], task['open'],
+          task['start'], task['games'])
+
+def makeTasks(games, shard, seed, policy, budget, maxMoves):
+  tasks = []
+  for start in range(seed, seed + games, shard):
+    size = min(shard, seed + games - start)
+    for circular, open in VARIANTS:
+      tasks.append(dict(policy = policy, budget = budget, maxMoves = maxMoves, circular = circular,
+                        open = open, start = start, games = size))
+  return tasks
+
+def loadResults(path):
+  '''
+  Read the shards already finished from the results file.
+  A line cut short by an interruption is ignored, as is one written by
+  an older version without all the fields of a task.
+  '''
+  done = {}
+  if not path or not os.path.exists(path):
+    return done
+  with open(path) as f:
+    for line in f:
+      try:
+        result = json.loads(line)
+        done[shardKey(result)] = result
+      except (ValueError, KeyError):
+        continue
+  return done
+
+class Tally:
+  '''
+  Running totals of games and wins for each variant
+  '''
+  def __init__(self):
+    self.games = dict.fromkeys(VARIANTS, 0)
+    self.wins = dict.fromkeys(VARIANTS, 0)
+
+  def add(self, result):
+    variant = result['circular'], result['open']
+    self.games[variant] += result['games']
+    self.wins[variant] += result['wins']
+
+  def report(self, out = sys.stdout):
+    for variant in VARIANTS:
+      games, wins = self.games[variant], self.wins[variant]
+      low, high = wilson(wins, games)
+      rate = wins / games if games else 0.0
+      out.write('%s %7d/%-7d won  %6.2f%%  (%.2f%% - %.2f%%)\n' %
+                (variantName(*variant), wins, games, 100*rate, 100*low, 100*high))
+    out.flush()
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Estimate win rates of the spider variants')
+  parser.add_argument('-n', '--games', type = int, default = 10000, help = 'number of deals per variant')
+  parser.add_argument('-p', '--policy', choices = sorted(POLICIES), default = 'search')
+  parser.add_argument('-m', '--max-moves', type = int, default = MAX_MOVES,
+                      help = 'give up on a game after this many moves')
+  parser.add_argument('-b', '--budget', type = int, default = SEARCH_BUDGET,
+                      help = 'positions the search policy may look at for each plan')
+  parser.add_argument('-s', '--seed', type = int, default = 0, help = 'deal ID of the first deal')
+  parser.add_argument('--shard', type = int, default = 500, help = 'deals per shard')
+  parser.add_argument('-w', '--workers', type = int, default = os.cpu_count(),
+                      help = 'number of worker processes')
+  parser.add_argument('-r', '--results', default = 'montecarlo.jsonl',
+                      help = 'file of finished shards, for resuming an interrupted run')
+  args = parser.parse_args(argv)
+
+  tally = Tally()
+  done = loadResults(args.results)
+  tasks = []
+  skipped = 0
+  for task in makeTasks(args.games, args.shard, args.seed, args.policy, args.budget, args.max_moves):
+    result = done.get(shardKey(task))
+    if result is None:
+      tasks.append(task)
+    else:
+      tally.add(result)
+      skipped += 1
+  total = len(tasks)
+  print('%d shards to play, %d already done' % (total, skipped))
+  if skipped:
+    tally.report()
+  start = time.perf_counter()
+  with open(args.results, 'a') as out, multiprocessing.Pool(args.workers) as pool:
+    for n, result in enumerate(pool.imap_unordered(runShard, tasks), 1):
+      out.write(json.dumps(result) + '\n')
+      out.flush()
+      tally.add(result)
+      elapsed = time.perf_counter() - start
+      print('\n%d/%d shards, %.0f s' % (n, total, elapsed))
+      tally.report()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,227 @@
+# record.py
+'''
+Game records.  A game is recorded as its deal ID, which recreates the
+deal exactly, the variant it was dealt in, and the entries of its undo
+stack, so a whole game takes a few hundred bytes.  The options may be
+changed partway through a game, so each change is an entry of its own,
+an Options, among the moves, just where it was made.  There are two formats:
+    JSON lines   one game per line, as an object with the fields of Game;
+                 moves is a list of undo entries [source, target, n, flip],
+                 and of changes of options {"circular": c, "open": o}
+    binary       the bytes MAGIC, then for each game a header packed as HEADER
+                 (deal ID, flags, number of entries) followed by two bytes an
+                 entry: 18*source + target, and 2*n + flip for a move, or
+                 OPTIONS and the flags for a change of options
+Files whose names end in BINARY_EXT are binary; any others are JSON lines.
+
+Games are read one at a time, and replay plays them through a model
+without the undo and redo stacks, so an archive of any size can be
+replayed for analysis at the speed of the model, without any Tk machinery.
+'''
+import json, time, struct, argparse
+from collections import namedtuple
+from model import Model, DEAL, ACE
+
+MAGIC = b'SPDR\x01'
+HEADER = struct.Struct('<QBI')
+BINARY_EXT = '.spider'
+CIRCULAR = 1          # bits of the flags in the binary header and entries
+OPEN = 2
+OPTIONS = 255         # first byte of a change of options in the binary format
+
+Game = namedtuple('Game', 'dealId circular open moves')
+Options = namedtuple('Options', 'circular open')
+
+def gameOf(model):
+  '''
+  Return the Game played so far in model
+  '''
+  moves = model.undoStack[:]
+  end = len(moves)
+  for n, circular, open in reversed(model.optionChanges):
+    moves.insert(min(n, end), Options(circular, open))
+  return Game(model.dealId, *model.dealOptions, moves)
+
+def isBinary(path):
+  return path.endswith(BINARY_EXT)
+
+def writeJson(f, game):
+  record = game._asdict()
+  record['moves'] = [entry._asdict() if isinstance(entry, Options) else
+                     [entry[0], entry[1], entry[2], int(entry[3])] for entry in game.moves]
+  f.write(json.dumps(record, separators = (',', ':')) + '\n')
+
+def readJson(f):
+  for line in f:
+    if not line.strip():
+      continue
+    record = json.loads(line)
+    moves = [Options(entry['circular'], entry['open']) if isinstance(entry, dict) else
+             tuple(entry) for entry in record['moves']]
+    yield Game(record['dealId'], record['circular'], record['open'], moves)
+
+def flagsOf(circular, open):
+  return CIRCULAR*bool(circular) | OPEN*bool(open)
+
+def writeBinary(f, game):
+  f.write(HEADER.pack(game.dealId, flagsOf(game.circular, game.open), len(game.moves)))
+  data = bytearray()
+  for entry in game.moves:
+    if isinstance(entry, Options):
+      data += bytes((OPTIONS, flagsOf(*entry)))
+    else:
+      s, t, n, flip = entry
+      data += bytes((18*s + t, 2*n + bool(flip)))
+  f.write(data)
+
+def readBinary(f):
+  if f.read(len(MAGIC)) != MAGIC:
+    raise ValueError('%s is not a spider game record' % f.name)
+  while True:
+    header = f.read(HEADER.size)
+    if not header:
+      return
+    dealId, flags, count = HEADER.unpack(header)
+    data = f.read(2*count)
+    if len(data) < 2*count:
+      raise ValueError('%s ends in the middle of a game' % f.name)
+    moves = [Options(bool(b & CIRCULAR), bool(b & OPEN)) if a == OPTIONS else 
+             (a // 18, a % 18, b >> 1, b & 1) for a, b in zip(data[::2], data[1::2])]
+    yield Game(dealId, bool(flags & CIRCULAR), bool(flags & OPEN), moves)
+
+def save(path, games):
+  '''
+  Write the games to the file at path, in the format its name calls for
+  '''
+  if isBinary(path):
+    with open(path, 'wb') as f:
+      f.write(MAGIC)
+      for game in games:
+        writeBinary(f, game)
+  else:
+    with open(path, 'w') as f:
+      for game in games:
+        writeJson(f, game)
+
+def load(path):
+  '''
+  Yield the games in the file at path, one at a time
+  '''
+  if isBinary(path):
+    with open(path, 'rb') as f:
+      yield from readBinary(f)
+  else:
+    with open(path) as f:
+      yield from readJson(f)
+
+def replay(model, game):
+  '''
+  Deal the game in model and make its moves, leaving the undo and redo
+  stacks empty.  This is the fast way to get to the end of a game.
+  The position reached becomes the start of the game, as far as restart
+  is concerned, and moves counts the moves replayed.
+  '''
+  model.deal(game.circular, game.open, game.dealId)
+  moves = 0
+  for entry in game.moves:
+    if isinstance(entry, Options):
+      model.changeOptions(*entry)
+    else:
+      model.replay(entry)
+      moves += entry != DEAL
+  model.moveCount = moves
+  model.checkpoints = [(0, model.snapshot())]
+  model.dealOptions = (model.circular, model.open)
+  model.optionChanges = []
+
+def isLegal(model, record):
+  '''
+  Could the undo entry record have been made in the position of model?
+  A change of options always could.
+  '''
+  if isinstance(record, Options):
+    return True
+  if record == DEAL:
+    return bool(model.stock) and model.canDeal()
+  s, t, n, f = record
+  if not (0 <= s < 10 and 0 <= t < 18 and s != t and n > 0):
+    return False
+  w = model.waste[s]
+  idx = len(w) - n
+  if not model.canSelect(s, idx):
+    return False
+  if t >= 10:
+    legal = n == 13 and w[-1].rank == ACE and not model.foundations[t-10]
+  else:
+    model.grab(s, idx)
+    legal = bool(model.canDrop(t))
+    model.abortMove()
+  flip = idx > 0 and model.faceDown(w[idx-1])
+  return legal and bool(f) == flip
+
+def check(game):
+  '''
+  Play the game through a scratch model, and raise ValueError if any
+  of its moves is not legal, so that a damaged record is found before
+  it touches a model in use.
+  '''
+  model = Model()
+  model.deal(game.circular, game.open, game.dealId)
+  for n, record in enumerate(game.moves):
+    if not isLegal(model, record):
+      raise ValueError('move %d of the game, %s, is not legal' % (n+1, tuple(record)))
+    if isinstance(record, Options):
+      model.changeOptions(*record)
+    else:
+      model.replay(record)
+
+def restore(model, game):
+  '''
+  Deal the game in model and redo its moves, so that the game can be
+  played on, or its moves undone, just as if it had been played in model.
+  The options are changed as they were in the game.
+  '''
+  model.deal(game.circular, game.open, game.dealId)
+  for entry in game.moves:
+    if isinstance(entry, Options):
+      model.changeOptions(*entry)
+    else:
+      model.redoStack = [entry]
+      model.redo()
+      model.checkpoint()
+
+def replayAll(paths, model = None):
+  '''
+  Replay every game in the files named in paths through a single model.
+  Yield the model at the end of each game.
+  '''
+  if model is None:
+    model = Model()
+  for path in paths:
+    for game in load(path):
+      replay(model, game)
+      yield model
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Replay or convert recorded spider games')
+  parser.add_argument('files', nargs = '+', help = 'game records, binary if named *%s' % BINARY_EXT)
+  parser.add_argument('--convert', metavar = 'FILE',
+                      help = 'write all the games to FILE instead of replaying them')
+  args = parser.parse_args(argv)
+
+  if args.convert:
+    save(args.convert, (game for path in args.files for game in load(path)))
+    return
+  start = time.perf_counter()
+  games = wins = down = 0
+  for model in replayAll(args.files):
+    games += 1
+    wins += model.win()
+    down += model.downCards()
+  elapsed = time.perf_counter() - start
+  print('%d games replayed, %d won, %.1f cards face down at the end on average' % 
+        (games, wins, down/games if games else 0))
+  print('%.1f s, %.0f games/s' % (elapsed, games/elapsed if elapsed else 0))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,483 @@
+# simulate.py
+'''
+Headless simulation of spider solitaire.
+Games are dealt and played by a policy through the model alone, without
+any Tk machinery, so that large batches of deals can be played quickly
+for deal statistics and bot evaluation.
+
+A policy is a function policy(model, seen) that returns a list of moves
+to make in turn, each as in Model.legalMoves, or an empty list if it would
+rather deal another row (or give up).  seen is the set of the hashes of the
+positions reached so far in the game; a policy must not lead back to any
+of them, so that it can't go round in circles.  The model must be left in
+the position it was given in.
+
+The policies judge positions by an evaluation, a weighted count of the
+complete suits, cards turned up, spaces, and the cards lying on cards that
+are not their successors; see gain.  A card on the next higher rank of
+another suit costs nearly as much as one on any other card, since it is
+building in suit that completes suits.
+
+The search policy is the one that wins games, mostly of circular spider;
+the greedy policy, which looks only one move ahead, hardly ever wins, but
+is for deal statistics in bulk.  Its games are played by playGreedy on
+plain lists of card codes set up from a compact State, rather than through
+a Model, at TARGET_RATE games a minute or more on one core; see bench.py.
+'''
+import time, heapq, random, functools, itertools, argparse
+from collections import namedtuple
+from model import Model, CARDS, SUCCESSORS, ACE, KING
+from state import State, UP, PILES
+import record
+
+MAX_MOVES = 1000      # give up on a game after this many moves
+SEARCH_BUDGET = 200   # positions the search policy expands for each plan
+TARGET_RATE = 100000  # games a minute playGreedy must reach on one core
+
+SUIT = 1000           # weights of the evaluation
+FLIP = 30
+SPACE = 5
+BREAK = (0, 8, 9)     # a card on its successor, on the next rank in another suit, on anything else
+
+Result = namedtuple('Result', 'won moves dealsLeft down stuck')
+
+RANKS = bytes(card.rank for card in CARDS)
+UP_BITS = bytes(flags & UP for flags in range(256))   # translates flags to whether a card is face up
+
+def breakCosts(circular):
+  '''
+  Return the table of breakCost for every pair of cards: the cost for
+  card a to lie face up on card b is at 104*a + b
+  '''
+  successors = SUCCESSORS[circular]
+  costs = bytearray(104*104)
+  for a, b in itertools.product(CARDS, repeat = 2):
+    if successors[104*a.code + b.code]:
+      cost = BREAK[0]
+    elif b.rank - a.rank == 1 or (circular and b.rank == ACE and a.rank == KING):
+      cost = BREAK[1]
+    else:
+      cost = BREAK[2]
+    costs[104*a.code + b.code] = cost
+  return bytes(costs)
+BREAK_COSTS = (breakCosts(False), breakCosts(True))
+
+def follows(model, card, other):
+  '''
+  Can card be placed on other, ignoring suits?
+  '''
+  return (other.rank - card.rank == 1 or
+          (model.circular and other.rank == ACE and card.rank == KING))
+
+def breakCost(model, card, below):
+  '''
+  What it costs in the evaluation for card to lie face up on below
+  '''
+  if model.successors[104*card.code + below.code]:
+    return BREAK[0]
+  return BREAK[1] if follows(model, card, below) else BREAK[2]
+
+def progress(model, move):
+  '''
+  Does the move make progress?  Moves that merely shift a run from one
+  card of the next higher rank to another, without improving the suit,
+  are excluded, as are moves into a space that don't turn up a card.
+  This keeps the policies from cycling.
+  '''
+  source, idx, dest = move
+  if dest >= 10:
+    return True
+  w = model.waste[source]
+  target = model.waste[dest]
+  card = w[idx]
+  below = w[idx-1] if idx else None
+  exposes = below is not None and model.faceDown(below)
+  if not target:
+    return exposes
+  if below is None or exposes or not follows(model, card, below):
+    return True
+  return below.suit != card.suit and target[-1].suit == card.suit
+
+def gain(model, move):
+  '''
+  Return the change the move makes to the evaluation of the position.
+  Only the card the run leaves, and the card it goes on, matter.
+  '''
+  source, idx, dest = move
+  w = model.waste[source]
+  card = w[idx]
+  if idx == 0:
+    answer = SPACE
+  elif model.faceDown(w[idx-1]):
+    answer = FLIP
+  else:
+    answer = breakCost(model, card, w[idx-1])
+  if dest >= 10:
+    return answer + SUIT
+  target = model.waste[dest]
+  if target:
+    return answer - breakCost(model, card, target[-1])
+  return answer - SPACE
+
+def greedyPolicy(model, seen):
+  '''
+  Make the move that gains the most, if any gains at all
+  '''
+  best, plan = 0, []
+  for move in model.legalMoves(True):
+    value = gain(model, move)
+    if value > best and model.hashAfter(*move) not in seen:
+      best, plan = value, [move]
+  return plan
+
+def randomPolicy(model, seen):
+  '''
+  Make any move that makes progress
+  '''
+  moves = [m for m in model.legalMoves()
+           if progress(model, m) and model.hashAfter(*m) not in seen]
+  return [model.rng.choice(moves)] if moves else []
+
+def goTo(model, path, line):
+  '''
+  The moves in path have been made in model.  Undo them back to where
+  line branches off, and make the rest of line.
+  '''
+  common = 0
+  for a, b in zip(path, line):
+    if a != b:
+      break
+    common += 1
+  for n in range(len(path) - common):
+    model.undo()
+  for move in line[common:]:
+    model.move(*move)
+
+def searchPolicy(model, seen, budget = SEARCH_BUDGET):
+  '''
+  Search the positions that can be reached by moves, best first by their
+  evaluation, expanding at most budget of them, and return the moves to
+  the best one found, if it is better than this one.  A line ends with a
+  move that turns up a card, since what can be done next depends on the
+  card, so the search never looks at a face down card, and with a move to
+  a foundation.
+  '''
+  counter = itertools.count()
+  heap = [(0, 0, next(counter), ())]     # (-evaluation, moves, tie breaker, line)
+  reached = set()
+  best, plan = 0, ()
+  path = ()
+  while heap and budget > 0:
+    negative, length, tie, line = heapq.heappop(heap)
+    goTo(model, path, line)
+    path = line
+    budget -= 1
+    for move in model.legalMoves(True):
+      key = model.hashAfter(*move)
+      if key in seen or key in reached:
+        continue
+      reached.add(key)
+      value = gain(model, move) - negative
+      source, idx, dest = move
+      ends = dest >= 10 or (idx and model.faceDown(model.waste[source][idx-1]))
+      if value <= best and ends:
+        continue
+      following = line + (move,)
+      if value > best or (value == best and best > 0 and length + 1 < len(plan)):
+        best, plan = value, following
+      if not ends:
+        heapq.heappush(heap, (-value, length + 1, next(counter), following))
+  goTo(model, path, ())
+  return list(plan)
+
+POLICIES = {'greedy': greedyPolicy, 'random': randomPolicy, 'search': searchPolicy}
+
+def makePolicy(name, budget = SEARCH_BUDGET):
+  '''
+  Return the policy of the given name, with the given budget if it is the search
+  '''
+  policy = POLICIES[name]
+  if policy is searchPolicy:
+    policy = functools.partial(searchPolicy, budget = budget)
+  return policy
+
+def fillSpaces(model):
+  '''
+  The policy wants to deal, but there is an empty waste pile.
+  Fill each space with the top card of the tallest pile.
+  Return False if that can't be done.
+  '''
+  for dest, target in enumerate(model.waste):
+    if target:
+      continue
+    source = max(range(10), key = lambda k: len(model.waste[k]))
+    w = model.waste[source]
+    if len(w) < 2:
+      return False
+    model.move(source, len(w)-1, dest)
+  return True
+
+def play(model, policy, maxMoves = MAX_MOVES):
+  '''
+  Play out the game currently dealt in model.
+  Return a Result.
+  '''
+  count = 0
+  seen = {model.hash}
+  while not model.win() and count < maxMoves:
+    plan = policy(model, seen)
+    for move in plan[:maxMoves - count]:
+      model.move(*move)
+      seen.add(model.hash)
+    count += len(plan)
+    if plan:
+      continue
+    if not model.stock:
+      break
+    if not model.canDeal() and not fillSpaces(model):
+      break
+    model.dealUp()
+    seen.add(model.hash)
+  won = model.win()
+  return Result(won, model.moves(), model.dealsLeft(), model.downCards(), model.stuck())
+
+def topRun(w, up, successors):
+  '''
+  Return the length of the face-up run on top of the pile w of card codes
+  '''
+  i = len(w) - 1
+  while i and up[w[i-1]] and successors[104*w[i] + w[i-1]]:
+    i -= 1
+  return len(w) - i
+
+def hasMoves(waste, runs, circular):
+  '''
+  Is there any legal move among the piles of card codes in waste, as in Model.hasMoves?
+  '''
+  for k, w in enumerate(waste):
+    if not w:
+      continue
+    run = runs[k]
+    top = RANKS[w[-1]]
+    if run >= 13 and top == ACE:
+      return True
+    for dest, target in enumerate(waste):
+      if dest == k:
+        continue
+      if not target:
+        return True
+      offset = RANKS[target[-1]] - 1 - top
+      if circular:
+        offset %= 13
+      if 0 <= offset < run:
+        return True
+  return False
+
+def moveRun(waste, runs, up, successors, k, idx, dest):
+  '''
+  Move the cards from idx up from pile k of waste onto pile dest, or to
+  a foundation if dest is 10 or more, keeping up and runs up to date.
+  Return 1 if a card is turned up, and 0 if not.
+  '''
+  w = waste[k]
+  if dest < 10:
+    n = len(w) - idx
+    target = waste[dest]
+    runs[dest] = runs[dest] + n if target and successors[104*w[idx] + target[-1]] else n
+    target.extend(w[idx:])
+  del w[idx:]
+  if not w:
+    runs[k] = 0
+    return 0
+  if up[w[-1]]:
+    runs[k] = topRun(w, up, successors)
+    return 0
+  up[w[-1]] = 1
+  runs[k] = 1
+  return 1
+
+def playGreedy(state, circular, maxMoves = MAX_MOVES):
+  '''
+  Play out the game from the position in state, as play does with the
+  greedy policy, and return the Result.  The piles are lists of card codes,
+  and only what the greedy policy looks at is kept up to date.  Only a move
+  of a whole run, or of a suit to a foundation, can gain, since a card in
+  a run lies on its successor, so for each pile only the bottom card of
+  the run on top is looked at.  Every move gains, so no position comes
+  round again, and seen isn't needed.
+  '''
+  waste = [list(state.pile(k)) for k in range(10)]
+  stock = list(state.pile(PILES-1))
+  suits = sum(1 for p in range(10, 18) if state.pile(p))
+  faceUp = bytes(state.flags).translate(UP_BITS)
+  up = bytearray(104)
+  for code in itertools.compress(state.codes, faceUp):
+    up[code] = 1
+  successors = SUCCESSORS[circular]
+  costs = BREAK_COSTS[circular]
+  ranks = RANKS
+  runs = [topRun(w, up, successors) if w else 0 for w in waste]
+  down = state.offsets[10] - faceUp.count(1, 0, state.offsets[10])
+  piles = range(10)
+  # For each pile, the bottom card of the run on top, or -1 for a space, what
+  # moving the run gains where it leaves, or -1 for leaving a space, and the
+  # rank that can go on it, or 0; and wants[rank], the piles rank can go on,
+  # in any order, since ties are settled by pile number below
+  bottoms = [-1] * 10
+  leaves = [0] * 10
+  wanted = [0] * 10
+  wants = [[] for rank in range(KING+1)]
+  def note(k):
+    # pile k has changed
+    w = waste[k]
+    if wanted[k]:
+      wants[wanted[k]].remove(k)
+    if not w:
+      bottoms[k] = -1
+      wanted[k] = 0
+      return
+    bottom = len(w) - runs[k]
+    card = bottoms[k] = w[bottom]
+    if bottom == 0:
+      leaves[k] = -1
+    else:
+      leaves[k] = FLIP if not up[w[bottom-1]] else costs[104*card + w[bottom-1]]
+    rank = ranks[w[-1]] - 1
+    if not rank and circular:
+      rank = KING
+    wanted[k] = rank
+    if rank:
+      wants[rank].append(k)
+  for k in piles:
+    note(k)
+  count = moves = 0
+  while suits < 8 and count < maxMoves:
+    # The move that gains most, the first of them in the order of legalMoves;
+    # (k, -1, dest) moves the whole run on top of pile k
+    space = bottoms.index(-1) if -1 in bottoms else -1
+    best = 0
+    for k in piles:
+      card = bottoms[k]
+      if card < 0:
+        continue
+      if runs[k] >= 13:
+        w = waste[k]
+        if ranks[w[-1]] == ACE:
+          idx = len(w) - 13
+          value = SUIT + (SPACE if idx == 0 else FLIP if not up[w[idx-1]] else
+                          costs[104*w[idx] + w[idx-1]])
+          if value > best:
+            best, move = value, (k, idx, 10)
+      leave = leaves[k]
+      if leave < 0:
+        leave = SPACE
+      elif space >= 0 and leave - SPACE > best:
+        best, move = leave - SPACE, (k, -1, space)
+      for dest in wants[ranks[card]]:
+        if dest == k:
+          continue
+        value = leave - costs[104*card + waste[dest][-1]]
+        if value > best or (value == best and best and move[0] == k and dest < move[2]):
+          best, move = value, (k, -1, dest)
+    if best:
+      k, idx, dest = move
+      if idx < 0:
+        idx = len(waste[k]) - runs[k]
+      suits += dest >= 10
+      down -= moveRun(waste, runs, up, successors, k, idx, dest)
+      note(k)
+      if dest < 10:
+        note(dest)
+      moves += 1
+      count += 1
+      continue
+    if not stock:
+      break
+    if space >= 0:
+      # Fill each space with the top card of the tallest pile, as fillSpaces does
+      filled = True
+      for dest in piles:
+        if waste[dest]:
+          continue
+        k = max(piles, key = lambda k: len(waste[k]))
+        if len(waste[k]) < 2:
+          filled = False
+          break
+        down -= moveRun(waste, runs, up, successors, k, len(waste[k]) - 1, dest)
+        note(k)
+        note(dest)
+        moves += 1
+      if not filled:
+        break
+    for k in piles:
+      card = stock.pop()
+      w = waste[k]
+      runs[k] = runs[k] + 1 if successors[104*card + w[-1]] else 1
+      w.append(card)
+      up[card] = 1
+      note(k)
+  won = suits == 8
+  stuck = not won and not hasMoves(waste, runs, circular) and (not stock or not all(waste))
+  return Result(won, moves, len(stock) // 10, down, stuck)
+
+def simulate(games, policy = searchPolicy, circular = False, open = False,
+             maxMoves = MAX_MOVES, model = None, seed = None):
+  '''
+  Deal and play the given number of games.
+  Yield a Result for each.
+  A single Model is reused for every deal, except that games of the greedy
+  policy are played by playGreedy, without a Model, unless one is given.
+  If seed is given, the games are the deals with IDs seed, seed+1, ...,
+  so that any range of deals can be played again, or split among workers.
+  '''
+  if policy is greedyPolicy and model is None:
+    rng = random.Random(seed)
+    for n in range(games):
+      dealId = rng.getrandbits(64) if seed is None else seed + n
+      yield playGreedy(State.deal(dealId, open), circular, maxMoves)
+    return
+  if model is None:
+    model = Model(seed)
+  for n in range(games):
+    model.deal(circular, open, None if seed is None else seed + n)
+    yield play(model, policy, maxMoves)
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Play spider solitaire games without the GUI')
+  parser.add_argument('-n', '--games', type = int, default = 1000, help = 'number of games to play')
+  parser.add_argument('-p', '--policy', choices = sorted(POLICIES), default = 'search')
+  parser.add_argument('-c', '--circular', action = 'store_true', help = 'play circular spider')
+  parser.add_argument('-o', '--open', action = 'store_true', help = 'play open spider')
+  parser.add_argument('-m', '--max-moves', type = int, default = MAX_MOVES,
+                      help = 'give up after this many moves')
+  parser.add_argument('-b', '--budget', type = int, default = SEARCH_BUDGET,
+                      help = 'positions the search policy may look at for each plan')
+  parser.add_argument('-s', '--seed', type = int, default = None,
+                      help = 'deal ID of the first game; the rest follow in order')
+  parser.add_argument('-r', '--record', metavar = 'FILE',
+                      help = 'save the games played, as in record.py')
+  args = parser.parse_args(argv)
+
+  start = time.perf_counter()
+  wins = moves = down = stuck = 0
+  model = Model(args.seed) if args.record else None
+  played = []
+  for result in simulate(args.games, makePolicy(args.policy, args.budget), args.circular, args.open,
+                         args.max_moves, model, args.seed):
+    if args.record:
+      played.append(record.gameOf(model))
+    wins += result.won
+    moves += result.moves
+    down += result.down
+    stuck += result.stuck
+  elapsed = time.perf_counter() - start
+  if args.record:
+    record.save(args.record, played)
+  games = args.games
+  print('%d games, %d won (%.2f%%)' % (games, wins, 100*wins/games))
+  print('average %.1f moves, %.1f cards face down at the end' % (moves/games, down/games))
+  print('%d games lost at a dead end, with no move and no deal' % stuck)
+  print('%.1f s, %.0f games/min' % (elapsed, 60*games/elapsed))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,272 @@
+# solver.py
+'''
+Depth-first solver for open spider solitaire.
+With all cards face up, spider is a game of perfect information, so a
+position can be searched exhaustively: either a winning sequence of
+moves is found, or every line has been tried and the position is lost.
+Positions already searched are kept in a transposition table, since
+the same position is reached by many different move orders.
+
+Every legal move is tried in the end, so a position labelled lost is
+lost, but moves that seldom lead anywhere, such as those that only
+shuffle runs about, are tried last (see deferred).  The first move tried
+is the first of the plan of the search policy of simulate.py, so the
+first line searched is the game that policy would play.  The policy is
+asked for a plan only along that line, when the plan before has been
+played out, since it costs as much as a few hundred nodes; elsewhere,
+moves are tried in the order of the gain the policy sees in them.
+'''
+import time, itertools, argparse
+from collections import OrderedDict
+from model import Model, DEAL
+from simulate import follows, gain, searchPolicy, SEARCH_BUDGET
+
+WON = 'won'
+LOST = 'lost'
+UNKNOWN = 'unknown'     # the search was cut off by a node or time limit
+
+ENTRY_BYTES = 150       # rough cost of one table entry, for the memory budget
+EVICT_WINDOW = 4        # number of least recently used entries considered for eviction
+
+class Table:
+  '''
+  Transposition table of positions already searched, mapping each
+  position key to the depth at which it was reached.  It holds at most
+  size entries.  When it is full, the EVICT_WINDOW least recently used
+  entries are considered, and the deepest of them is evicted, since
+  deep positions are the cheapest to search again.
+  '''
+  def __init__(self, size):
+    self.size = size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, key):
+    entries = self.entries
+    if key in entries:
+      entries.move_to_end(key)
+      self.hits += 1
+      return True
+    return False
+
+  def add(self, key, depth):
+    entries = self.entries
+    if len(entries) >= self.size:
+      oldest = itertools.islice(entries.items(), EVICT_WINDOW)
+      victim = max(oldest, key = lambda item: item[1])[0]
+      del entries[victim]
+      self.evictions += 1
+    entries[key] = depth
+
+def deferred(model, move, space):
+  '''
+  Should the move be tried only after the others?  That is, does it go to
+  a space other than space, the first one, or move a whole pile to a space,
+  or shuffle runs about?  Spaces are not interchangeable, since a deal puts
+  a different card on each pile, but it seldom matters which one is used.
+  '''
+  source, idx, dest = move
+  if dest < 10 and not model.waste[dest]:
+    return dest != space or idx == 0
+  return shuffles(model, move)
+
+def shuffles(model, move):
+  '''
+  Does the move only shuffle runs about?  That is, does it split a run in
+  suit, or move a run from a card of the next higher rank to another
+  such card, without building in suit?
+  '''
+  source, idx, dest = move
+  if dest >= 10 or idx == 0:
+    return False
+  w = model.waste[source]
+  card, below = w[idx], w[idx-1]
+  if model.faceDown(below):
+    return False
+  if model.successors[104*card.code + below.code]:
+    return True
+  target = model.waste[dest]
+  return (bool(target) and follows(model, card, below) and
+          not model.successors[104*card.code + target[-1].code])
+
+class Solver:
+  '''
+  Search the current position of model for a win.
+  The model is returned to its original position, with its undo and
+  redo stacks intact, when the search is done.
+  Moves in the solution are tuples (source, index, dest) as in
+  Model.legalMoves, or DEAL for dealing a row.
+  '''
+  def __init__(self, model, memory = 64, maxNodes = None, timeLimit = None,
+               budget = SEARCH_BUDGET):
+    # memory is the budget for the transposition table in megabytes,
+    # budget that of the search policy for each plan
+    self.model = model
+    self.budget = budget
+    self.onPath = set()
+    self.table = Table(max(1, memory * 2**20 // ENTRY_BYTES))
+    self.maxNodes = maxNodes
+    self.timeLimit = timeLimit
+    self.nodes = 0
+    self.elapsed = 0.0
+    self.status = UNKNOWN
+    self.solution = None
+    self.stopped = False      # set by stop
+
+  def stop(self):
+    '''
+    Cut the search off at the next node.  This may be called from
+    another thread, to abandon a search running in the background.
+    '''
+    self.stopped = True
+
+  def key(self):
+    return self.model.hash
+
+  def newPlan(self):
+    return searchPolicy(self.model, self.onPath, self.budget)
+
+  def planAfter(self, plan, move):
+    '''
+    Return the plan for the position move has just led to, given plan, that
+    of the position before: the rest of plan, if move was the first of it,
+    or a new plan, if that was the last move of plan, or plan was empty and
+    move is the deal the policy would make then.  Off the line of the
+    policy, there is no plan, None.
+    '''
+    if plan is None:
+      return None
+    if plan and move == plan[0]:
+      return plan[1:] or self.newPlan()
+    if not plan and move == DEAL:
+      return self.newPlan()
+    return None
+
+  def orderedMoves(self, plan):
+    '''
+    Return all the moves to try in the current position, best first: the
+    first move of plan, if there is one, then the rest by the gain the
+    policy sees in them, then dealing, and the deferred moves last.
+    '''
+    model = self.model
+    first = plan[:1] if plan else []
+    space = next((k for k, w in enumerate(model.waste) if not w), None)
+    moves = []
+    later = []
+    for move in model.legalMoves():
+      if move in first:
+        continue
+      (later if deferred(model, move, space) else moves).append(move)
+    moves.sort(key = lambda m: gain(model, m), reverse = True)
+    if model.stock and model.canDeal():
+      moves.append(DEAL)
+    return first + moves + later
+
+  def play(self, move):
+    if move == DEAL:
+      self.model.dealUp()
+    else:
+      self.model.move(*move)
+
+  def cutOff(self, start):
+    if self.stopped:
+      return True
+    if self.maxNodes is not None and self.nodes >= self.maxNodes:
+      return True
+    return self.timeLimit is not None and time.perf_counter() - start >= self.timeLimit
+
+  def solve(self):
+    '''
+    Search for a win.  Return the list of moves, or None if the
+    position is lost or the search was cut off; self.status tells which.
+    '''
+    model = self.model
+    base = len(model.undoStack)
+    redo = model.redoStack[:]
+    start = time.perf_counter()
+    table = self.table
+    path = []
+    keys = [self.key()]
+    onPath = self.onPath = set(keys)
+    plans = [self.newPlan()]
+    stack = [iter(self.orderedMoves(plans[-1]))]
+    self.status = LOST
+    self.solution = None
+    try:
+      if model.win():
+        self.status = WON
+        self.solution = []
+        return self.solution
+      while stack:
+        if self.cutOff(start):
+          self.status = UNKNOWN
+          break
+        try:
+          move = next(stack[-1])
+        except StopIteration:
+          stack.pop()
+          plans.pop()
+          if path:
+            path.pop()
+            onPath.discard(keys.pop())
+            model.undo()
+          continue
+        self.play(move)
+        self.nodes += 1
+        if model.win():
+          self.status = WON
+          self.solution = path + [move]
+          break
+        key = self.key()
+        if key in onPath or key in table:
+          model.undo()
+          continue
+        table.add(key, len(path))
+        path.append(move)
+        keys.append(key)
+        onPath.add(key)
+        plans.append(self.planAfter(plans[-1], move))
+        stack.append(iter(self.orderedMoves(plans[-1])))
+    finally:
+      while len(model.undoStack) > base:
+        model.undo()
+      model.redoStack = redo
+      model.trimCheckpoints()
+      self.elapsed = time.perf_counter() - start
+    return self.solution
+
+  def nodesPerSecond(self):
+    return self.nodes / self.elapsed if self.elapsed else 0.0
+
+  def stats(self):
+    table = self.table
+    return ('%s: %d nodes in %.2f s (%.0f nodes/s), table %d entries, %d hits, %d evictions' %
+            (self.status, self.nodes, self.elapsed, self.nodesPerSecond(),
+             len(table), table.hits, table.evictions))
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Label open spider deals as won or lost')
+  parser.add_argument('-n', '--games', type = int, default = 10, help = 'number of deals to solve')
+  parser.add_argument('-c', '--circular', action = 'store_true', help = 'play circular spider')
+  parser.add_argument('-m', '--memory', type = int, default = 64,
+                      help = 'transposition table budget in megabytes')
+  parser.add_argument('--max-nodes', type = int, default = None, help = 'give up after this many nodes')
+  parser.add_argument('--time-limit', type = float, default = None, help = 'give up after this many seconds')
+  parser.add_argument('-s', '--seed', type = int, default = None,
+                      help = 'deal ID of the first deal; the rest follow in order')
+  args = parser.parse_args(argv)
+
+  model = Model(args.seed)
+  for n in range(args.games):
+    model.deal(args.circular, True, None if args.seed is None else args.seed + n)
+    solver = Solver(model, args.memory, args.max_nodes, args.time_limit)
+    solution = solver.solve()
+    moves = ' in %d moves' % len(solution) if solution is not None else ''
+    print('deal %d %s%s' % (model.dealId, solver.stats(), moves))
+
+if __name__ == '__main__':
+  main()
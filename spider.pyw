@@ -8,11 +8,26 @@ can see the suits.  In most cases, all you can tell is the rank and color.
 Also, they use the protocol that when the player completes a suits from King to Ace, it is 
 automatically taken out of play immediately. The rule is that it remains in play until
 the player takes it out.  Often, this can be used to great advantage in organizing other piles.
+
+Options:
+  --timing        report how long the window takes to appear (or set SPIDER_TIMING)
+  --instrument    time the handlers of the view and count their Tk calls, with an 
+                  Instruments menu to see the results and profile the session
+                  (or set SPIDER_INSTRUMENT); if SPIDER_PROFILE is set to a file name,
+                  the whole session is profiled, and the statistics written there
+  --make-sheet    pack the card images into a single sprite sheet, cards/sheet.png, 
+                  which is then used instead of the individual files
 '''
+import time
+START = time.perf_counter()     # for the startup timing mode
 from model import Model 
-from view import View
+from view import View, makeSheet
+from instrument import Instruments
+import record
+from history import History, report
 import tkinter as tk
 from tkinter.messagebox import showerror, showinfo, askokcancel
+from tkinter.filedialog import asksaveasfilename, askopenfilename
 import sys, os
 
 
@@ -47,33 +62,142 @@ Make plays involving higher cards earlier.   If you have a 2, 3, 5, and 6 availa
 
 The most important thing in organizing the waste piles are empty piles, or "spaces".  These can be used to organize the other waste piles.  One space is good, two are better, and three are very powerful.  Don't fill in a space with a permanent card until you have exploited it to the utomost.
 
+HINTS
+Choose Hint from the Game menu to have a move you might make outlined.  In an open game, the hint is the first move of a win, if one can be found in a couple of seconds.  Otherwise, it is a move following the strategy above.  You can go on playing while the hint is being worked out.
+
+AUTO PLAY
+Choose Auto Play from the Game menu to make all the moves that can't hurt: complete suits are removed to the foundations, and runs are moved onto cards of the same suit, until there are no more such moves.  Each move can be undone as usual.
+
 VARIANTS 
 In circular spider solitaire, a King may be placed on top of an Ace and a run may have a King on top of an Ace, so that the 3, 2, Ace, King, Queen of Clubs can be moved onto a 4.  A run can comprise more than 13 cards.  The run must still be in sequence from King down to Ace before being moved to a foundation pile.
 
 OPTIONS
 The game may be played "open" so that all cards are dealt face up.  You can switch back and forth in the same game, so that you can "peek".  You can also switch back and forth between circular and normal mode, to allow a limited number of "cheats."
 
+STATISTICS
+Every game you play is kept in a history when you win it, start another, or quit.  Choose Statistics from the Game menu to see how many games of each variant you have played and won.
+
+SAVING GAMES
+Choose Save from the Game menu to save the game you are playing, and Open to go on with a saved game later.  All your moves are saved with the game, so they can still be undone.
+
 BUTTONS
 The "Undo" and Redo" buttons are self-explanatory.  The "Restart" button puts the game back to the beginning, but you can still redo all your moves.  The "Redeal" button is similar, but it put the game back to the position just before the previous deal." 
 
 '''        
 class Spider:
-  def __init__(self):
+  def __init__(self, timing = False, instrument = False, profile = None):
+    # If timing is true, report how long the window takes to appear
+    # If instrument is true, or profile is the name of a file for the profile 
+    # statistics, record the latency of the view's handlers
     self.model = Model()
+    self.history = None       # opened by recordGame or showStatistics when first needed
+    self.recorded = False     # whether the game in the model has been put in the history
+    self.statsText = None     # made by showStatistics when first needed
+    self.instruments = None
+    self.profile = profile
+    if instrument or profile:
+      self.instruments = Instruments()
+      self.instruments.install(View)
     self.view = View(self, self.quit, width=1000, height=1000, scrollregion=(0, 0, 950, 3000) )
-    self.makeHelp()
+    self.helpText = None      # made by showHelp when first needed
+    self.reportText = None    # made by showReport when first needed
+    self.view.onWin = self.recordGame
+    if self.instruments:
+      self.instruments.attach(self.view.root)
+      if profile:
+        self.instruments.startProfile()
     self.circular = tk.BooleanVar()
     self.open = tk.BooleanVar() 
     self.circular.set(False)
     self.open.set(False)
-    self.circular.trace('w', self.optionChanged)
-    self.open.trace('w', self.optionChanged)
+    self.circular.trace('w', lambda *args: self.optionChanged(self.circular.get(), self.model.open))
+    self.open.trace('w', lambda *args: self.optionChanged(self.model.circular, self.open.get()))
     self.makeMenu()
+    if timing:
+      self.view.root.after_idle(self.reportStartup)
     self.view.start()      #  start the event loop
+
+  def reportStartup(self):
+    print('window ready in %.0f ms, %d card images decoded' % 
+          (1000*(time.perf_counter() - START), len(self.view.images)))
         
   def deal(self):
     model = self.model
+    self.recordGame()
     model.deal(self.circular.get(), self.open.get())
+    self.recorded = False
+    self.view.show()
+
+  def openHistory(self):
+    if self.history is None:
+      try:
+        self.history = History()
+      except Exception as e:
+        showerror('No history', 'Cannot open the game history: %s' % e)
+    return self.history
+
+  def recordGame(self):
+    '''
+    Put the game in the history, as finished or abandoned, 
+    unless it has already been put there, or no move has been made
+    '''
+    model = self.model
+    if self.recorded or not model.undoStack or not self.openHistory():
+      return
+    self.history.add(model)
+    self.recorded = True
+
+  def showStatistics(self):
+    if not self.openHistory():
+      return
+    if self.statsText is None:
+      top = self.statsText = tk.Toplevel()
+      top.transient(self.view.root)
+      top.protocol("WM_DELETE_WINDOW", top.withdraw)
+      top.title("Spider Statistics")
+      top.text = tk.Text(top, height=16, width=64, font=('courier', 11, 'normal'))
+      top.text.pack(expand=tk.YES, fill=tk.BOTH)
+      tk.Button(top, text='Dismiss', command=top.withdraw).pack()
+    lines = report(self.history.stats())
+    lines += ['', 'Recent games', '']
+    for dealId, circular, open, moves, down, won, played in self.history.recent(5):
+      lines.append('%s  %-8s %-6s %4d moves  %s' % 
+                   (time.strftime('%Y-%m-%d %H:%M', time.localtime(played)),
+                    'circular' if circular else 'normal', 'open' if open else 'closed', moves,
+                    'won' if won else '%d down' % down))
+    text = self.statsText.text
+    text.delete('1.0', tk.END)
+    text.insert('1.0', '\n'.join(lines))
+    self.statsText.deiconify()
+    
+  def saveGame(self):
+    path = asksaveasfilename(title='Save Game', defaultextension=record.BINARY_EXT,
+                             filetypes=[('Spider games', '*'+record.BINARY_EXT), 
+                                        ('JSON lines', '*.jsonl')])
+    if path:
+      record.save(path, [record.gameOf(self.model)])
+
+  def openGame(self):
+    path = askopenfilename(title='Open Game', 
+                           filetypes=[('Spider games', '*'+record.BINARY_EXT), 
+                                      ('JSON lines', '*.jsonl'), ('All files', '*')])
+    if not path:
+      return
+    try:
+      game = next(record.load(path), None)
+      if game is not None:
+        record.check(game)
+    except (OSError, ValueError) as e:
+      showerror('Cannot open game', str(e))
+      return
+    if game is None:
+      showerror('Cannot open game', 'There is no game in %s.' % path)
+      return
+    self.recordGame()
+    record.restore(self.model, game)
+    self.recorded = False
+    self.circular.set(self.model.circular)
+    self.open.set(self.model.open)
     self.view.show()
     
   def makeHelp(self):
@@ -103,6 +227,11 @@ class Spider:
     
     game = tk.Menu(top, tearoff=False)
     game.add_command(label='New', command=self.deal)
+    game.add_command(label='Open...', command=self.openGame)
+    game.add_command(label='Save...', command=self.saveGame)
+    game.add_command(label='Hint', command=self.view.findHint)
+    game.add_command(label='Statistics', command=self.showStatistics)
+    game.add_command(label='Auto Play', command=self.view.autoPlay)
     game.add_command(label='Help', command = self.showHelp)  
     game.add_command(label='Quit', command=self.quit)
     
@@ -112,22 +241,77 @@ class Spider:
     options.add_checkbutton(label='Circular', variable=self.circular)
     options.add_checkbutton(label='Open',  variable=self.open)
     top.add_cascade(label='Options', menu=options)
+
+    if self.instruments:
+      self.recording = tk.BooleanVar(value=True)
+      self.profiling = tk.BooleanVar(value=self.instruments.profiling())
+      self.recording.trace('w', self.recordingChanged)
+      self.profiling.trace('w', self.profilingChanged)
+      instruments = tk.Menu(top, tearoff=False)
+      instruments.add_checkbutton(label='Record', variable=self.recording)
+      instruments.add_command(label='Report', command=self.showReport)
+      instruments.add_command(label='Reset', command=self.instruments.reset)
+      instruments.add_separator()
+      instruments.add_checkbutton(label='Profile', variable=self.profiling)
+      instruments.add_command(label='Save Profile...', command=self.saveProfile)
+      top.add_cascade(label='Instruments', menu=instruments)
        
   def notdone(self):
     showerror('Not implemented', 'Not yet available') 
 
   def showHelp(self):
+    if self.helpText is None:
+      self.makeHelp()
     self.helpText.deiconify()
     self.helpText.text.see('1.0')  
   
-  def optionChanged(self, *args):
-    self.model.reset(self.circular.get(), self.open.get())
-    self.model.adjustOpen(self.open.get())
+  def recordingChanged(self, *args):
+    self.instruments.recording = self.recording.get()
+
+  def profilingChanged(self, *args):
+    if self.profiling.get():
+      self.instruments.startProfile()
+    else:
+      self.instruments.stopProfile()
+
+  def saveProfile(self):
+    if not self.instruments.profiling():
+      showerror('Not profiling', 'Turn on Profile first.')
+      return
+    path = asksaveasfilename(title='Save Profile', defaultextension='.prof')
+    if path:
+      self.instruments.dumpProfile(path)
+
+  def showReport(self):
+    if self.reportText is None:
+      top = self.reportText = tk.Toplevel()
+      top.transient(self.view.root)
+      top.protocol("WM_DELETE_WINDOW", top.withdraw)
+      top.title("Spider Instruments")
+      top.text = tk.Text(top, height=40, width=110, font=('courier', 10, 'normal'))
+      top.text.pack(expand=tk.YES, fill=tk.BOTH)
+    self.reportText.text.delete('1.0', tk.END)
+    self.reportText.text.insert('1.0', self.instruments.report())
+    self.reportText.deiconify()
+
+  def optionChanged(self, circular, open):
+    # Each option is traced on its own, so setting both to match the model,
+    # as openGame does, changes nothing in between
+    self.model.changeOptions(circular, open)
     self.view.show()
     
   def quit(self):
+    self.recordGame()
+    if self.instruments:
+      print(self.instruments.report())
+      self.instruments.stopProfile(self.profile)
     self.view.root.quit()
       
 if __name__ == "__main__":
-  Spider()
+  if '--make-sheet' in sys.argv:
+    makeSheet(os.path.join(os.path.dirname(sys.argv[0]), 'cards'))
+  else:
+    Spider('--timing' in sys.argv or bool(os.environ.get('SPIDER_TIMING')),
+           '--instrument' in sys.argv or bool(os.environ.get('SPIDER_INSTRUMENT')),
+           os.environ.get('SPIDER_PROFILE'))
     
\ No newline at end of file
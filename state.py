@@ -0,0 +1,118 @@
+# state.py  Compact representation of a spider position
+
+import random
+from array import array
+
+PILES = 19        # 10 waste piles, 8 foundations and the stock, numbered as in Model.piles
+UP = 1            # flag bits
+PEEK = 2
+
+# The steps of random.shuffle for a deck of 104: the index i of each swap, the number n
+# of places to swap it with, and the number of random bits drawn to choose one of them
+SHUFFLE_STEPS = [(i, i+1, (i+1).bit_length()) for i in reversed(range(1, 104))]
+
+def shuffled(dealId):
+  '''
+  Return the codes of the cards in the order the deal with the given ID
+  shuffles them into.  This is random.Random(dealId).shuffle, written out
+  with the bit counts worked out in advance, so it draws the same numbers
+  and gives the same order, in two thirds of the time.
+  '''
+  deck = list(range(104))
+  getrandbits = random.Random(dealId).getrandbits
+  for i, n, bits in SHUFFLE_STEPS:
+    j = getrandbits(bits)
+    while j >= n:
+      j = getrandbits(bits)
+    deck[i], deck[j] = deck[j], deck[i]
+  return deck
+
+class State:
+  '''
+  A position packed into three small buffers:
+      codes    the 104 card codes, pile by pile, each pile from the bottom up
+      flags    the UP and PEEK bits of the card in the same slot of codes
+      offsets  20 offsets into codes, so that pile p is codes[offsets[p]:offsets[p+1]]
+  Copying, comparing and hashing a State are a few operations on byte strings,
+  rather than touching every card object.
+  A State knows nothing of the undo and redo stacks.
+  '''
+  __slots__ = ('codes', 'flags', 'offsets')
+
+  def __init__(self, codes, flags, offsets):
+    self.codes = codes
+    self.flags = flags
+    self.offsets = offsets
+
+  @classmethod
+  def deal(cls, dealId, open = False):
+    '''
+    Return the position Model.deal lays out for the deal with the given ID,
+    without a Model: 44 cards dealt face down, unless open is true, and a
+    row face up, from the top of the stock
+    '''
+    deck = shuffled(dealId)
+    down = UP if open else 0
+    codes = bytearray()
+    flags = bytearray()
+    offsets = array('B', [0])
+    for k in range(10):
+      pile = deck[103-k:59:-10]
+      codes += bytes(pile)
+      codes.append(deck[59-k])
+      flags += bytes([down] * len(pile))
+      flags.append(UP)
+      offsets.append(len(codes))
+    offsets.extend([len(codes)] * 8)
+    codes += bytes(deck[:50])
+    flags += bytes(50)
+    offsets.append(len(codes))
+    return cls(codes, flags, offsets)
+
+  @classmethod
+  def fromModel(cls, model):
+    codes = bytearray()
+    flags = bytearray()
+    offsets = array('B', [0])
+    up, peek = model.up, model.peek
+    for pile in model.piles:
+      for card in pile:
+        codes.append(card.code)
+        flags.append(UP*up[card.code] | PEEK*peek[card.code])
+      offsets.append(len(codes))
+    return cls(codes, flags, offsets)
+
+  def restore(self, model):
+    '''
+    Arrange the cards of model as recorded here
+    '''
+    cards, up, peek = model.cards, model.up, model.peek
+    codes, flags, offsets = self.codes, self.flags, self.offsets
+    for p, pile in enumerate(model.piles):
+      a, b = offsets[p], offsets[p+1]
+      pile[:] = [cards[c] for c in codes[a:b]]
+    for c, f in zip(codes, flags):
+      up[c] = f & UP
+      peek[c] = (f & PEEK) >> 1
+
+  def copy(self):
+    return State(self.codes[:], self.flags[:], self.offsets[:])
+
+  def pile(self, p):
+    '''
+    Return the codes of the cards in pile p, from the bottom up
+    '''
+    return self.codes[self.offsets[p]:self.offsets[p+1]]
+
+  def key(self):
+    '''
+    Return an immutable byte string identifying the position
+    '''
+    return bytes(self.codes) + bytes(self.flags) + self.offsets.tobytes()
+
+  def __eq__(self, other):
+    return (self.codes == other.codes and self.flags == other.flags and
+            self.offsets == other.offsets)
+
+  def __hash__(self):
+    return hash(self.key())
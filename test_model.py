@@ -0,0 +1,207 @@
+# test_model.py
+'''
+Randomized consistency tests of the model.
+Run "python -m unittest test_model".
+'''
+import os, random, tempfile, unittest
+from model import Model, DEAL
+from solver import Solver
+from state import State
+import simulate, record
+
+def playRandom(model, rng, moves):
+  '''
+  Make up to the given number of random legal moves, dealing when there are none
+  '''
+  for n in range(moves):
+    legal = model.legalMoves()
+    if legal:
+      model.move(*rng.choice(legal))
+    elif model.stock and model.canDeal():
+      model.dealUp()
+    else:
+      break
+
+def stepTo(model, n):
+  '''
+  Go to the position after the first n entries of the undo stack one move at a time
+  '''
+  while len(model.undoStack) > n:
+    model.undo()
+  while len(model.undoStack) < n and model.canRedo():
+    model.redo()
+
+class JumpTest(unittest.TestCase):
+  '''
+  jumpTo, restart and redeal must reach the same position, with the same
+  hash, as undoing and redoing one move at a time.
+  '''
+  def check(self, model, rng, jumps = 40):
+    undo = len(model.undoStack)
+    end = undo + len(model.redoStack)
+    stepTo(model, 0)
+    truth = [(model.snapshot(), model.hash)]
+    while model.canRedo():
+      model.redo()
+      truth.append((model.snapshot(), model.hash))
+    for k in range(jumps):
+      n = rng.randrange(end + 1)
+      model.jumpTo(n)
+      self.assertEqual(len(model.undoStack), n)
+      self.assertEqual(len(model.undoStack) + len(model.redoStack), end)
+      self.assertEqual((model.snapshot(), model.hash), truth[n], 'jumpTo(%d)' % n)
+      self.assertEqual(model.hash, model.computeHash())
+    stepTo(model, undo)
+
+  def testJumpTo(self):
+    for seed in range(20):
+      rng = random.Random(seed)
+      model = Model(seed)
+      model.deal(seed % 2 == 1, seed % 4 >= 2, seed)
+      playRandom(model, rng, 120)
+      model.jumpTo(rng.randrange(len(model.undoStack) + 1))
+      self.check(model, rng)
+
+  def testOpenedLater(self):
+    # Turning Open on partway through a game, as Spider.optionChanged does
+    for seed in range(20):
+      rng = random.Random(seed)
+      model = Model(seed)
+      model.deal(seed % 2 == 1, False, 11 + seed)
+      playRandom(model, rng, 60)
+      model.changeOptions(model.circular, True)
+      playRandom(model, rng, 30)
+      self.check(model, rng)
+      model.jumpTo(0)
+      state, hash = model.snapshot(), model.hash
+      stepTo(model, len(model.redoStack))
+      model.restart()
+      self.assertEqual((model.snapshot(), model.hash), (state, hash))
+
+  def testAfterSolver(self):
+    # The solver pushes and undoes moves of its own, then puts the redo stack back
+    for seed in range(5):
+      rng = random.Random(seed)
+      model = Model(seed)
+      model.deal(False, True, 42 + seed)
+      playRandom(model, rng, 45)
+      model.jumpTo(5)
+      Solver(model, maxNodes = 100).solve()
+      self.check(model, rng)
+
+class SolverTest(unittest.TestCase):
+  def testAllMovesTried(self):
+    # A position is lost only if every legal move has been tried
+    for seed in range(10):
+      rng = random.Random(seed)
+      model = Model(seed)
+      model.deal(seed % 2 == 1, True, seed)
+      playRandom(model, rng, 40 + 10*seed)
+      solver = Solver(model)
+      expected = model.legalMoves()
+      if model.stock and model.canDeal():
+        expected.append(DEAL)
+      for plan in (None, [], simulate.searchPolicy(model, {model.hash})):
+        moves = solver.orderedMoves(plan)
+        self.assertEqual(sorted(moves), sorted(expected))
+        if plan:
+          self.assertEqual(moves[0], plan[0])
+
+class PolicyTest(unittest.TestCase):
+  def testHashAfter(self):
+    for seed in range(10):
+      rng = random.Random(seed)
+      model = Model(seed)
+      model.deal(seed % 2 == 1, seed % 4 >= 2, seed)
+      for n in range(100):
+        moves = model.legalMoves()
+        if not moves:
+          break
+        move = rng.choice(moves)
+        expected = model.hashAfter(*move)
+        model.move(*move)
+        self.assertEqual(model.hash, expected, 'move %s' % (move,))
+
+  def testSearch(self):
+    # The plan must be legal, and the search must leave the position as it was
+    model = Model(0)
+    for seed in range(3):
+      model.deal(True, seed == 1, seed)
+      seen = {model.hash}
+      for n in range(5):
+        state, undo = model.snapshot(), model.undoStack[:]
+        plan = simulate.searchPolicy(model, seen)
+        self.assertEqual((model.snapshot(), model.undoStack), (state, undo))
+        for move in plan:
+          self.assertIn(move, model.legalMoves())
+          model.move(*move)
+          self.assertNotIn(model.hash, seen)
+          seen.add(model.hash)
+
+  def testStateDeal(self):
+    # State.deal must lay out the same position as Model.deal
+    model = Model(0)
+    for seed in range(20):
+      model.deal(seed % 2 == 1, seed % 4 >= 2, seed)
+      self.assertEqual(State.deal(seed, seed % 4 >= 2), model.snapshot())
+
+  def testPlayGreedy(self):
+    # playGreedy must play every game just as play does with the greedy policy
+    model = Model(0)
+    for seed in range(40):
+      circular, open = seed % 2 == 1, seed % 4 >= 2
+      model.deal(circular, open, seed)
+      expected = simulate.play(model, simulate.greedyPolicy)
+      self.assertEqual(simulate.playGreedy(State.deal(seed, open), circular), expected,
+                       'deal %d' % seed)
+
+  def testCircularWins(self):
+    results = list(simulate.simulate(5, circular = True, open = True, seed = 1))
+    self.assertTrue(any(result.won for result in results))
+    self.assertFalse(any(result.won and result.stuck for result in results))
+
+  def testWonNotStuck(self):
+    # A won game has no moves and no deal left, but it is not at a dead end
+    model = Model(0)
+    for pile in model.piles:
+      pile.clear()
+    for k, f in enumerate(model.foundations):
+      f.extend(sorted(model.cards[13*k:13*k+13], key = lambda card: -card.rank))
+    model.up[:] = bytes([1]*104)
+    model.restore(model.snapshot())
+    self.assertTrue(model.win())
+    self.assertFalse(model.stuck())
+
+class RecordTest(unittest.TestCase):
+  '''
+  A saved game, with its options changed partway through, must open to the
+  same position, with the same hash, in either format.
+  '''
+  def testRoundTrip(self):
+    with tempfile.TemporaryDirectory() as folder:
+      for seed in range(8):
+        rng = random.Random(seed)
+        model = Model(seed)
+        model.deal(seed % 2 == 1, False, 7 + seed)
+        playRandom(model, rng, 30)
+        model.changeOptions(model.circular, True)
+        playRandom(model, rng, 20)
+        model.changeOptions(not model.circular, model.open)
+        if seed % 4 >= 2:
+          stepTo(model, len(model.undoStack) - 10)   # undo past the changes
+        playRandom(model, rng, 20)
+        for name in ('game.jsonl', 'game' + record.BINARY_EXT):
+          path = os.path.join(folder, name)
+          record.save(path, [record.gameOf(model)])
+          game = next(record.load(path))
+          record.check(game)
+          other = Model()
+          record.restore(other, game)
+          self.assertEqual((other.snapshot(), other.hash), (model.snapshot(), model.hash), name)
+          self.assertEqual((other.circular, other.open), (model.circular, model.open))
+          self.assertEqual(other.undoStack, model.undoStack)
+          record.replay(other, game)
+          self.assertEqual((other.snapshot(), other.hash), (model.snapshot(), model.hash), name)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -42,7 +42,10 @@ class ScrolledCanvas(tk.Frame):
   A canvas with scrollbars.
   It automatically delegates unknown methods to the Canvas widget with __getattr__,
   so we don't have to put in a one-line definition every time we use another method.
+  Set onScroll to a function to be called with the fractions (first, last) of the 
+  visible part of the canvas whenever it scrolls vertically, or is resized.
   '''
+  onScroll = None
   
   def __init__(self, master, scrolls, **kwargs):
     tk.Frame.__init__(self, master)
@@ -52,8 +55,9 @@ class ScrolledCanvas(tk.Frame):
     if scrolls in (tk.BOTH, tk.VERTICAL):
       ybar = tk.Scrollbar(self, orient = tk.VERTICAL)
       ybar.config(command=canv.yview)                   # xlink sbar and canv
-      canv.config(yscrollcommand=ybar.set)              # move one moves other
+      canv.config(yscrollcommand=self.yscroll)          # move one moves other
       ybar.grid(row = 0, column = 1, sticky = 'ns')
+      self.ybar = ybar
 
     if scrolls in (tk.BOTH, tk.HORIZONTAL):
       xbar = tk.Scrollbar(self, orient = tk.HORIZONTAL)
@@ -67,5 +71,10 @@ class ScrolledCanvas(tk.Frame):
   def __getattr__(self, name):
     return getattr(self.canvas, name)
   
+  def yscroll(self, first, last):
+    self.ybar.set(first, last)
+    if self.onScroll:
+      self.onScroll(float(first), float(last))
+
   def setCursor(self, cursor):
     self.canvas.configure(cursor = cursor)
\ No newline at end of file
@@ -4,11 +4,12 @@ The visual interface for spider solitaire.
 The view knows about the model, but not vice versa
 Thce canvas widget is used for both view and controller.
 '''
-import sys, os, itertools
+import sys, os, time, itertools
 import tkinter as tk
-from model import SUITNAMES, RANKNAMES, ALLRANKS, Card
-from tkinter.messagebox import showerror
+from model import SUITNAMES, RANKNAMES, COLORNAMES, ALLRANKS, STOCK, DEAL, Card
+from tkinter.messagebox import showerror, showinfo
 from utils import ScrolledCanvas
+from hint import Hint
 from tkinter.simpledialog import SimpleDialog
 
 # Constants determining the size and layout of cards and stacks.  We
@@ -29,6 +30,7 @@ OFFSET2 = 20
 BACKGROUND = '#070'
 OUTLINE = '#060'        # outline color of foundation files
 CELEBRATE = 'yellow'     # Color of "you won" message
+HINT_COLOR = 'yellow'    # outline of the cards a hint suggests moving, and where
 BUTTON = 'forest green'
 
 # Cursors
@@ -38,9 +40,86 @@ SELECT_CURSOR = 'hand2'
 STATUS_FONT = ('Helvetica', '12', 'normal')
 STATUS_BG = 'gray'
 
-SCROLL_INTERVAL = 5     # miliseconds
+FRAME_INTERVAL = 16     # miliseconds between updates of the cards being dragged
+
+# Autoscroll speed in pixels per second, when a dragged card passes the edge of the 
+# window.  It grows with the distance past the edge, up to a maximum.
+SCROLL_MIN_SPEED = 150
+SCROLL_ACCELERATION = 15    # per pixel past the edge
+SCROLL_MAX_SPEED = 1500
 SCROLL_DISTANCE = '2m'
-imageDict = {}   # hang on to images, or they may disappear!
+SHEET = 'sheet.png'      # optional sprite sheet of all the card images; see makeSheet
+LOAD_BATCH = 4           # images decoded per idle callback by loadRest
+HINT_POLL = 50           # miliseconds between checks for a hint being ready
+
+class CardImages:
+  '''
+  The card images, indexed by back color for backs, and by (rank, suit)
+  for faces.  Each is decoded the first time it's needed, so the window 
+  can appear after decoding only the backs and the cards face up in the 
+  first deal.  The images are cut from a sprite sheet if there is one in
+  the card directory, and read from the individual files otherwise.
+  The dictionary hangs on to the images, or they may disappear!
+  '''
+  def __init__(self, cardDir):
+    self.cardDir = cardDir
+    self.images = {}
+    path = os.path.join(cardDir, SHEET)
+    self.sheet = tk.PhotoImage(file=path) if os.path.exists(path) else None
+
+  def __getitem__(self, key):
+    try:
+      return self.images[key]
+    except KeyError:
+      image = self.images[key] = self.load(key)
+      return image
+
+  def __len__(self):
+    return len(self.images)
+
+  @staticmethod
+  def keys():
+    '''
+    All the keys, in the order of the cells of the sprite sheet
+    '''
+    return list(itertools.product(ALLRANKS, SUITNAMES)) + ['blue', 'red']
+
+  def load(self, key):
+    if self.sheet is None:
+      if key in COLORNAMES:
+        name = key+'Back.gif'
+      else:
+        rank, suit = key
+        name = suit+RANKNAMES[rank]+'.gif'
+      return tk.PhotoImage(file=os.path.join(self.cardDir, name))
+    x, y = sheetCell(self.keys().index(key))
+    image = tk.PhotoImage(width=CARDWIDTH, height=CARDHEIGHT)
+    image.tk.call(image, 'copy', self.sheet, '-from', x, y, x+CARDWIDTH, y+CARDHEIGHT)
+    return image
+
+  def missing(self):
+    return [key for key in self.keys() if key not in self.images]
+
+def sheetCell(n):
+  # NW corner of cell n of the sprite sheet, which has 13 columns
+  return CARDWIDTH*(n%13), CARDHEIGHT*(n//13)
+
+def makeSheet(cardDir):
+  '''
+  Pack the individual card images into a sprite sheet, so that
+  the game reads one file instead of 54 when it starts.
+  '''
+  root = tk.Tk()
+  root.withdraw()
+  images = CardImages(cardDir)
+  images.sheet = None
+  keys = images.keys()
+  sheet = tk.PhotoImage(width=13*CARDWIDTH, height=CARDHEIGHT*((len(keys)+12)//13))
+  for n, key in enumerate(keys):
+    x, y = sheetCell(n)
+    sheet.tk.call(sheet, 'copy', images[key], '-to', x, y)
+  sheet.write(os.path.join(cardDir, SHEET), format='png')
+  root.destroy()
 
 class ButtonBar(tk.Canvas):
   def __init__(self, parent):
@@ -62,7 +141,8 @@ class View:
   Cards are represented as canvas image iitems,  displaying either the face
   or the back as appropriate.  Each card has the tag "card".  This is 
   crucial, since only canvas items tagged "card" will respond to mouse
-  clicks.
+  clicks.  The view refers to the items by their integer ids, kept in 
+  self.items by card code, rather than by tags.
   '''
   def __init__(self, parent, quit, **kwargs):
     # kwargs passed to Scrolled Canvas
@@ -99,6 +179,8 @@ class View:
                              bg = STATUS_BG, fg = 'Black', bd = 2)
     self.open =     tk.Label(status, text = " Open     ", relief = tk.RIDGE, font = STATUS_FONT, 
                              bg = STATUS_BG, fg = 'Black', bd = 2)
+    self.stuck =    tk.Label(status, text = " No moves left ", relief = tk.RIDGE, font = STATUS_FONT, 
+                             bg = STATUS_BG, fg = STATUS_BG, bd = 2)
     self.deals =    tk.Label(status, relief = tk.RIDGE, font = STATUS_FONT, 
                              bg = STATUS_BG, fg = 'Black', bd = 2)
     self.down =    tk.Label(status, relief = tk.RIDGE, font = STATUS_FONT, 
@@ -107,6 +189,7 @@ class View:
                              bg = STATUS_BG, fg = 'Black', bd = 2)
     self.circular.pack(expand=tk.NO, fill = tk.NONE, side = tk.LEFT)
     self.open.pack(expand=tk.NO, fill = tk.NONE, side = tk.LEFT)
+    self.stuck.pack(expand=tk.NO, fill = tk.NONE, side = tk.LEFT)
     self.deals.pack(expand=tk.NO, fill = tk.NONE, side = tk.RIGHT)
     self.down.pack(expand=tk.NO, fill = tk.NONE, side = tk.RIGHT)
     self.moves.pack(expand=tk.NO, fill = tk.NONE, side = tk.RIGHT)
@@ -118,12 +201,21 @@ class View:
     width = kwargs['width']
     height = kwargs['height']
     
+    self.items = [None] * 104     # canvas item ids of the cards, by code
+    self.codes = {}               # codes of the cards, by canvas item id
+    self.placed = [None] * 104    # where each card item is, by code; see place
+    self.shown = [None] * 104     # the image each card item shows, by code
+    self.stacked = [[] for p in range(STOCK+1)]   # codes in each pile as last shown; see restack
+    self.pending = {}             # images waiting for cards to be scrolled into view
+    self.viewport = None          # visible part of the tableau; None until first known
+    self.geometry = None          # cached by scrollGeometry
     self.loadImages()
     self.createCards()
     tableau.tag_bind("card", '<ButtonPress-1>', self.onClick)
     tableau.tag_bind("card", '<Double-Button-1>', self.onDoubleClick)
     tableau.canvas.bind('<B1-Motion>', self.drag)
     tableau.canvas.bind('<ButtonRelease-1>', self.onDrop)
+    tableau.canvas.bind('<Configure>', self.onResize)
     
     
     # Avoid scroll wheel problems on some Mac installations
@@ -140,103 +232,225 @@ class View:
                         text = "'The game is done! I've won! I've won!'\nQuoth she, and whistles thrice.",
                         fill = BACKGROUND, font=("Times", "32", "bold"), tag = 'winText', anchor=tk.NW)
     self.scrolling = False
+    self.frame = None         # pending dragFrame callback
+    self.pointer = None       # last pointer position reported while dragging
+    self.dragTop = 0          # top edge of the card grabbed, in canvas coordinates
+    self.scrollTime = 0       # when autoScroll last ran
+    self.scrollRemainder = 0  # pixels autoScroll has yet to scroll
+    self.status = {}          # status items as last shown; see updateStatus
+    self.hint = None          # Hint being looked for or shown
+    self.onWin = None         # function to call when the game is won
     self.buttons = ButtonBar(self.tableau)
     self.buttons.tag_bind('undo', '<ButtonPress-1>', self.undo)
     self.buttons.tag_bind('redo', '<ButtonPress-1>', self.redo)
     self.buttons.tag_bind('restart', '<ButtonPress-1>', self.restart)
     self.buttons.tag_bind('redeal', '<ButtonPress-1>', self.redeal)    
     self.show()
+    tableau.onScroll = self.onScroll
     
   def start(self):
     self.root.mainloop()
       
   def loadImages(self):
-    PhotoImage = tk.PhotoImage
+    '''
+    Decode the images needed for the first deal now, and the
+    rest a few at a time when the event loop is idle.
+    '''
     cardDir = os.path.join(os.path.dirname(sys.argv[0]), 'cards') 
-    blue = PhotoImage(file=os.path.join(cardDir,'blueBack.gif'))
-    red = PhotoImage(file=os.path.join(cardDir,'redBack.gif'))
-    imageDict['blue'] = blue
-    imageDict['red'] = red    
-    for rank, suit in itertools.product(ALLRANKS, SUITNAMES):
-      face = PhotoImage(file = os.path.join(cardDir, suit+RANKNAMES[rank]+'.gif'))               
-      imageDict[rank, suit] = face
+    images = self.images = CardImages(cardDir)
+    for back in COLORNAMES:
+      images[back]
+    model = self.model
+    for w in model.waste:
+      for card in w:
+        if model.faceUp(card):
+          images[card.rank, card.suit]
+    self.root.after(100, self.loadRest)
+
+  def loadRest(self):
+    missing = self.images.missing()
+    for key in missing[:LOAD_BATCH]:
+      self.images[key]
+    if len(missing) > LOAD_BATCH:
+      self.root.after_idle(self.loadRest)
       
   def createCards(self):
     model = self.model
     canvas = self.tableau    
     for card in model.deck:
-      c = canvas.create_image(-200, -200, image = None, anchor = tk.NW, tag = "card")
-      canvas.addtag_withtag('code%d'%card.code, c)
+      item = canvas.create_image(-200, -200, image = None, anchor = tk.NW, tag = "card")
+      self.items[card.code] = item
+      self.codes[item] = card.code
       
   def showWaste(self, k):
     '''
     Display waste pile number k
     '''
     x, y = self.waste[k]
-    canvas = self.tableau
-    for card in self.model.waste[k]:
-      tag = 'code%d'%card.code
-      canvas.coords(tag, x, y)
-      if card.faceUp():
-        foto = imageDict[card.rank, card.suit]
+    images = self.images
+    up = self.model.up
+    pile = self.model.waste[k]
+    first = self.restack(k, pile)
+    lift = False
+    for i, card in enumerate(pile):
+      lift = lift or i >= first
+      if up[card.code]:
+        lift = self.place(card, x, y, images[card.rank, card.suit], lift)
         y += OFFSET2
       else:
-        foto = imageDict[card.back]
+        lift = self.place(card, x, y, images[card.back], lift)
         y += OFFSET1
-      canvas.itemconfigure(tag, image = foto)
-      canvas.tag_raise(tag) 
 
-  def show(self):
-    model = self.model
+  def restack(self, p, pile):
+    '''
+    Return the index of the first card in pile number p that is not the card
+    that was there when the pile was last shown, and note the pile's order
+    '''
+    old = self.stacked[p]
+    codes = [card.code for card in pile]
+    first = 0
+    for a, b in zip(old, codes):
+      if a != b:
+        break
+      first += 1
+    self.stacked[p] = codes
+    return first
+
+  def place(self, card, x, y, image, lift = False):
+    '''
+    Put the card at (x, y), showing the given image.  Only what has changed
+    is sent to the canvas.  The card is raised if it has moved, or if lift
+    is true.  Return whether it was raised, since then everything above it
+    in its pile must be raised too; the callers pass that on as lift, 
+    from the first card not in its old place in the pile (see restack).
+    A card outside the visible part of the tableau keeps its old image 
+    until it is scrolled into view; see onScroll.
+    '''
+    code = card.code
+    item = self.items[code]
     canvas = self.tableau
-    self.showStock()
-    for k in range(10):
-      self.showWaste(k)
-    for k in range(8):
-      self.showFoundation(k)
-    if model.canUndo():
-      self.enableUndo()
-    else:
-      self.disableUndo()
-    if model.canRedo():
-      self.enableRedo()
+    moved = self.placed[code] != (x, y)
+    if moved:
+      self.placed[code] = (x, y)
+      canvas.coords(item, x, y)
+    if moved or lift:
+      canvas.tag_raise(item)
+    if self.shown[code] is image:
+      self.pending.pop(code, None)
+    elif self.visible(y):
+      self.shown[code] = image
+      canvas.itemconfigure(item, image = image)
+      self.pending.pop(code, None)
     else:
-      self.disableRedo() 
-    color = 'Black' if model.circular else STATUS_BG
-    self.circular.configure(fg=color)
-    color = 'Black' if model.open else STATUS_BG
-    self.open.configure(fg=color)    
-    color = CELEBRATE if model.win() else BACKGROUND
-    canvas.itemconfigure('winText', fill=color)
-    self.deals.configure(text='Deals %d'%model.dealsLeft())
-    self.down.configure(text='Down %d'%model.downCards())
-    self.moves.configure(text='Moves %d'%model.moves())
-    if model.win():
-      self.tableau.canvas.yview_moveto(0.0)
+      self.pending[code] = image
+    return moved or lift
+
+  def visible(self, y):
+    '''
+    Is a card with top edge y within a card's height of the visible part of the tableau?
+    '''
+    if self.viewport is None:
+      return True
+    top, bottom = self.viewport
+    return top - 2*CARDHEIGHT < y < bottom + CARDHEIGHT
+
+  def onScroll(self, first, last):
+    '''
+    The visible part of the tableau has changed.
+    Show the right images on cards that have come into view.
+    '''
+    extent = self.scrollGeometry()[0]
+    self.viewport = (first*extent, last*extent)
+    canvas = self.tableau
+    for code, image in list(self.pending.items()):
+      placed = self.placed[code]
+      if placed is not None and self.visible(placed[1]):
+        del self.pending[code]
+        self.shown[code] = image
+        canvas.itemconfigure(self.items[code], image = image)
+
+  def show(self):
+    '''
+    Redraw the piles the model has changed since the last call, and
+    update whatever parts of the status have changed.
+    '''
+    model = self.model
+    dirty = model.takeDirty()
+    if dirty:
+      self.cancelHint()
+    for k in dirty:
+      if k < 10:
+        self.showWaste(k)
+      elif k < 18:
+        self.showFoundation(k-10)
+      else:
+        self.showStock()
+    self.updateStatus('undo', model.canUndo())
+    self.updateStatus('redo', model.canRedo())
+    self.updateStatus('circular', model.circular)
+    self.updateStatus('open', model.open)
+    self.updateStatus('win', model.win())
+    if dirty:
+      self.updateStatus('deals', model.dealsLeft())
+      self.updateStatus('down', model.downCards())
+      self.updateStatus('moves', model.moves())
+      self.updateStatus('stuck', model.stuck())
+
+  def updateStatus(self, item, value):
+    '''
+    Show the new value of a status item, if it has changed
+    '''
+    if self.status.get(item) == value:
+      return
+    self.status[item] = value
+    if item == 'undo':
+      if value:
+        self.enableUndo()
+      else:
+        self.disableUndo()
+    elif item == 'redo':
+      if value:
+        self.enableRedo()
+      else:
+        self.disableRedo() 
+    elif item == 'circular':
+      self.circular.configure(fg='Black' if value else STATUS_BG)
+    elif item == 'open':
+      self.open.configure(fg='Black' if value else STATUS_BG)
+    elif item == 'stuck':
+      self.stuck.configure(fg='Black' if value else STATUS_BG)
+    elif item == 'win':
+      self.tableau.itemconfigure('winText', fill=CELEBRATE if value else BACKGROUND)
+      if value:
+        self.tableau.canvas.yview_moveto(0.0)
+        if self.onWin:
+          self.onWin()
+    elif item == 'deals':
+      self.deals.configure(text='Deals %d'%value)
+    elif item == 'down':
+      self.down.configure(text='Down %d'%value)
+    elif item == 'moves':
+      self.moves.configure(text='Moves %d'%value)
     
   def dealUp(self):
     self.model.dealUp()
     self.show()
       
   def showFoundation(self, k):
-    model = self.model
-    canvas = self.tableau
     x, y = self.foundations[k]
-    for card in model.foundations[k]:
-      tag = 'code%d'%card.code
-      canvas.itemconfigure(tag, image = imageDict[card.rank, card.suit])
-      canvas.coords(tag,x,y)
-      canvas.tag_raise(tag)
+    pile = self.model.foundations[k]
+    first = self.restack(10+k, pile)
+    lift = False
+    for i, card in enumerate(pile):
+      lift = self.place(card, x, y, self.images[card.rank, card.suit], lift or i >= first)
       
   def showStock(self):
-    model = self.model
-    canvas = self.tableau
     x, y = self.stock
-    for card in model.stock:
-      tag = 'code%d'%card.code
-      canvas.itemconfigure(tag, image = imageDict[card.back])
-      canvas.coords(tag,x,y)
-      canvas.tag_raise(tag)    
+    pile = self.model.stock
+    first = self.restack(STOCK, pile)
+    lift = False
+    for i, card in enumerate(pile):
+      lift = self.place(card, x, y, self.images[card.back], lift or i >= first)
                    
   def grab(self, selection, k, mouseX, mouseY):
     '''
@@ -251,59 +465,94 @@ class View:
     self.yfraction = canvas.canvas.yview()[0]
     west = self.waste[k][0]
     for card in selection:
-      tag = 'code%s'%card.code
-      canvas.tag_raise(tag)
-      canvas.addtag_withtag("floating", tag)
+      item = self.items[card.code]
+      image = self.pending.pop(card.code, None)
+      if image is not None:               # it must look right while it floats
+        self.shown[card.code] = image
+        canvas.itemconfigure(item, image = image)
+      canvas.tag_raise(item)
+      canvas.addtag_withtag("floating", item)
+      self.placed[card.code] = None      # it won't be where it was
     canvas.configure(cursor=SELECT_CURSOR)
     dx = 5 if mouseX - west > 10 else -5
     canvas.move('floating', dx, 0)
+    self.dragTop = canvas.coords(self.items[selection[0].code])[1]
     
   def drag(self, event):
+    '''
+    Motion events can arrive much faster than the screen is redrawn, so 
+    just note where the pointer is, and move the cards once per frame.
+    '''
+    self.pointer = event.x, event.y
+    if self.frame is None:
+      self.frame = self.tableau.canvas.after(FRAME_INTERVAL, self.dragFrame)
+
+  def dragFrame(self):
+    '''
+    Move the dragged cards to the last pointer position reported, and
+    start or stop scrolling as needed.
+    '''
+    self.frame = None
+    if not self.model.moving():
+      return
     canvas = self.tableau.canvas
-    sd = self.scrollDirection()
-    if not self.scrolling and sd != 0:
+    x, y = self.pointer
+    dx, dy = x - self.mouseX, y - self.mouseY
+    self.mouseX, self.mouseY = x, y
+    if dx or dy:
+      self.moveFloating(dx, dy)
+    if not self.scrolling and self.scrollVelocity() != 0:
       self.scrolling = True
-      canvas.after(SCROLL_INTERVAL, self.autoScroll, sd)
-    elif self.scrolling and sd == 0:
-      self.scrolling = False
-    try:
-      x, y = event.x, event.y
-      dx, dy = x - self.mouseX, y - self.mouseY
-      self.mouseX, self.mouseY = x, y
-      canvas.move('floating', dx, dy)
-    except AttributeError:
-      pass
+      self.scrollTime = time.perf_counter()
+      self.scrollRemainder = 0.0
+      canvas.after(FRAME_INTERVAL, self.autoScroll)
+
+  def flushDrag(self):
+    '''
+    Apply any pointer motion still waiting for the next frame
+    '''
+    if self.frame is not None:
+      self.tableau.canvas.after_cancel(self.frame)
+      self.dragFrame()
+
+  def moveFloating(self, dx, dy):
+    self.tableau.canvas.move('floating', dx, dy)
+    self.dragTop += dy
+
+  def scrollGeometry(self):
+    '''
+    Return the height of the scroll region and the height of the button bar.
+    They only change when the window does, so they are cached until it is resized.
+    '''
+    if self.geometry is None:
+      canvas = self.tableau.canvas
+      self.geometry = (int(canvas['scrollregion'].split()[3]), self.buttons.winfo_height())
+    return self.geometry
+
+  def onResize(self, event):
+    self.geometry = None
     
-  def scrollDirection(self):
-    '''
-    Return values:
-      1: scroll down
-      -1: scroll up
-      0: don't scroll
-    SIDE EFFECT:
-      Set SCROLL_INTERVAL to value dependent on how far the card's been dragged
-    '''
-    global SCROLL_INTERVAL
-    si = (50, 40, 30, 20, 10, 5)
-    answer = 0
+  def scrollVelocity(self):
+    '''
+    Return the speed at which to scroll, in pixels per second, positive
+    for scrolling down and negative for up, or 0 if the card being 
+    dragged is within the window.
+    '''
     canvas = self.tableau.canvas
     north, south = canvas.yview()
-    extent = int(canvas['scrollregion'].split()[3])
-    south  = int( south*extent)
-    north =  int(north*extent) + self.buttons.winfo_height() + 5
-    try:
-      left, top, right, bottom = canvas.bbox('current')
-      if bottom > south:
-        answer =  1
-        k = min(5, (bottom - south) // 16)
-        SCROLL_INTERVAL = si[k]
-      elif top < north:
-        answer = -1
-        k = min(5, (north - top) // 16)
-        SCROLL_INTERVAL = si[k]
-    except TypeError:
-      pass
-    return answer
+    extent, buttons = self.scrollGeometry()
+    south  = south*extent
+    north =  north*extent + buttons + 5
+    top = self.dragTop
+    bottom = top + CARDHEIGHT
+    if bottom > south:
+      distance = bottom - south
+    elif top < north:
+      distance = top - north
+    else:
+      return 0
+    speed = min(SCROLL_MAX_SPEED, SCROLL_MIN_SPEED + SCROLL_ACCELERATION*abs(distance))
+    return speed if distance > 0 else -speed
   
   def onClick(self, event):
     '''
@@ -311,23 +560,18 @@ class View:
     Clicks on foundation piles are ignored.
     '''
     self.scrolling = False
+    self.cancelHint()
     model = self.model
     canvas = self.tableau.canvas
-    tag = [t for t in canvas.gettags('current') if t.startswith('code')][0]
-    code = int(tag[4:])             # code of the card clicked
-    if model.stock.find(code) != -1:
+    code = self.codes[canvas.find_withtag('current')[0]]     # code of the card clicked
+    k, idx = model.locate(code)
+    if k == STOCK:
       if model.canDeal():
         self.dealUp()
-        return
       else:
         self.cannotDeal()
-    for k, w in enumerate(model.waste):
-      idx = w.find(code)
-      if idx != -1:
-        break
-    else:       # loop else
       return
-    selection = model.grab(k, idx)
+    selection = model.grabCard(code)
     self.grab(selection, k, event.x, event.y)
     
   def onDoubleClick(self, event):
@@ -338,17 +582,12 @@ class View:
     self.scrolling = False
     model = self.model
     canvas = self.tableau.canvas
-    tag = [t for t in canvas.gettags('current') if t.startswith('code')][0]
-    code = int(tag[4:])             # code of the card clicked
-    for k, w in enumerate(model.waste):
-      if [card for card in w if card.code == code]:
-        break
-    else:       # loop else
-      return 
-    if not model.completeSuit(k):
+    code = self.codes[canvas.find_withtag('current')[0]]     # code of the card clicked
+    k, idx = model.locate(code)
+    if k >= 10 or not model.completeSuit(k):
       return
     target = model.firstFoundation()
-    model.grab(k, len(w)-13)
+    model.grab(k, len(model.waste[k])-13)
     model.selectionToFoundation(target)
     self.show()
     
@@ -361,29 +600,43 @@ class View:
     '''
     canvas = self.tableau.canvas
     lo, hi = canvas.yview()
-    height = int(canvas['scrollregion'].split()[3])
+    height = self.scrollGeometry()[0]
     if event.num == 5 or event.delta < 0:       
       n = 1
     elif event.num == 4 or event.delta > 0:     
       n = -1
     canvas.yview_scroll(n, tk.UNITS)
     lo2, hi2 = canvas.yview()
-    canvas.move('floating', 0, (hi2-hi) * height)
+    if self.model.moving():
+      self.moveFloating(0, (hi2-hi) * height)
     
-  def autoScroll(self, n):
+  def autoScroll(self):
     '''
-    If scrolling has been scheduled and not canceled, scroll a bit and
-    schedule some more scrolling
+    Scroll while a card is dragged past the edge of the window.  This runs
+    once a frame, and scrolls by the velocity times the time elapsed since the
+    last frame, so the speed is the same however often it actually runs.
+    The canvas only scrolls by whole scroll increments, so the part of the 
+    distance not yet scrolled is carried over to the next frame.
     '''
-    if not self.scrolling:
+    if not self.scrolling or not self.model.moving():
+      self.scrolling = False
       return
     canvas = self.tableau.canvas
+    now = time.perf_counter()
+    elapsed, self.scrollTime = now - self.scrollTime, now
+    velocity = self.scrollVelocity()
     lo, hi = canvas.yview()
-    height = int(canvas['scrollregion'].split()[3])
-    canvas.yview_scroll(n, tk.UNITS)
-    lo2, hi2 = canvas.yview()
-    canvas.move('floating', 0, (hi2-hi) * height)
-    canvas.after(SCROLL_INTERVAL, self.autoScroll, n)
+    if velocity == 0 or (velocity < 0 and lo <= 0) or (velocity > 0 and hi >= 1):
+      self.scrolling = False
+      return
+    extent = self.scrollGeometry()[0]
+    self.scrollRemainder += velocity * elapsed
+    canvas.yview_moveto(lo + self.scrollRemainder/extent)
+    moved = (canvas.yview()[0] - lo) * extent
+    self.scrollRemainder -= moved
+    if moved:
+      self.moveFloating(0, moved)
+    canvas.after(FRAME_INTERVAL, self.autoScroll)
     
   def horizontalOverlap(self, w1, e1, w2, e2):
     '''
@@ -417,6 +670,7 @@ class View:
     If the selection is dropped above the bottom edge of the foundation piles, 
     then we must be dragging a complete suit.
     '''
+    self.flushDrag()
     self.scrolling = False
     model = self.model
     canvas = self.tableau.canvas   
@@ -465,6 +719,71 @@ class View:
     self.show()
     self.tableau.dtag('floating', 'floating')    
   
+  def autoPlay(self):
+    '''
+    Make all the safe moves, then redraw once
+    '''
+    if self.model.autoPlay():
+      self.show()
+
+  def findHint(self):
+    '''
+    Start looking for a hint, and check every HINT_POLL miliseconds
+    whether it has been found.
+    '''
+    self.cancelHint()
+    hint = self.hint = Hint(self.model)
+    self.root.after(HINT_POLL, self.pollHint, hint)
+
+  def pollHint(self, hint):
+    if hint is not self.hint:
+      return      # cancelled
+    if not hint.poll():
+      self.root.after(HINT_POLL, self.pollHint, hint)
+    elif hint.move is None:
+      self.hint = None
+      showinfo('Hint', 'There is no useful move.')
+    else:
+      self.showHint(hint.move)
+
+  def showHint(self, move):
+    '''
+    Outline the cards to move and where they go, or the stock if the
+    move is to deal
+    '''
+    model = self.model
+    if move == DEAL:
+      x, y = self.stock
+      self.outline(x, y, y+CARDHEIGHT)
+      return
+    source, idx, dest = move
+    w = model.waste[source]
+    x, y = self.placed[w[idx].code]
+    self.outline(x, y, self.placed[w[-1].code][1]+CARDHEIGHT)
+    if dest >= 10:
+      x, y = self.foundations[dest-10]
+    elif model.waste[dest]:
+      x, y = self.placed[model.waste[dest][-1].code]
+    else:
+      x, y = self.waste[dest]
+    self.outline(x, y, y+CARDHEIGHT)
+
+  def outline(self, x, north, south):
+    # The outline goes below the cards, so that it never gets the clicks
+    canvas = self.tableau
+    canvas.create_rectangle(x-3, north-3, x+CARDWIDTH+3, south+3, outline = HINT_COLOR,
+                            width = 3, tag = 'hint')
+    canvas.tag_lower('hint', 'card')
+
+  def cancelHint(self):
+    '''
+    Stop looking for a hint, or stop showing it
+    '''
+    if self.hint is not None:
+      self.hint.cancel()
+      self.hint = None
+      self.tableau.delete('hint')
+
   def cannotDeal(self):
     showerror('Cannot deal', "Can't deal with empty pile.")
     